@@ -0,0 +1,75 @@
+import json
+from typing import AsyncIterator, Optional
+
+import redis.asyncio as aioredis
+from fastapi import Request
+
+from backend.database.models import UserProfile, AnalysisStatus
+from backend.queue.progress import analysis_events_channel, latest_analysis_event_key, TERMINAL_STAGES
+from backend.constants import REDIS_URL, ANALYSIS_EVENTS_KEEPALIVE
+
+
+def format_sse(event: dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+class AnalysisEventStream:
+    """
+    Server-Sent Events stream of the progress events of the current analysis run of a user.
+    The stream starts with the latest state of the run, relays the events published by the worker,
+    and ends after the run completed or failed.
+    """
+
+    def __init__(self, user: UserProfile):
+        self.user = user
+        self._redis = aioredis.Redis.from_url(REDIS_URL)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._initial_event: Optional[dict] = None
+
+    async def connect(self):
+        """
+        Subscribes to the events of the user and reads the latest one.
+        Subscribing first ensures no event is missed between the two.
+        Raises redis.RedisError if Redis is not reachable.
+        """
+        await self._pubsub.subscribe(analysis_events_channel(self.user.email))
+        latest = await self._redis.get(latest_analysis_event_key(self.user.email))
+        event = json.loads(latest) if latest else None
+
+        if event is None or not self._is_current_run(event):
+            # the worker didn't publish the run yet, or no run is in progress
+            if self.user.analysis_status == AnalysisStatus.IN_PROGRESS:
+                stage = 'queued'
+            else:
+                stage = self.user.analysis_status.value.lower()
+            event = {'task_id': self.user.analysis_task_id, 'stage': stage}
+        self._initial_event = event
+
+    def _is_current_run(self, event: dict) -> bool:
+        return not self.user.analysis_task_id or event.get('task_id') == self.user.analysis_task_id
+
+    async def events(self, request: Request) -> AsyncIterator[str]:
+        try:
+            yield format_sse(self._initial_event)
+            if self._initial_event['stage'] in TERMINAL_STAGES:
+                return
+
+            while not await request.is_disconnected():
+                message = await self._pubsub.get_message(timeout=ANALYSIS_EVENTS_KEEPALIVE)
+                if message is None:
+                    # keeps the connection open through proxies, ignored by EventSource
+                    yield ": keep-alive\n\n"
+                    continue
+
+                event = json.loads(message['data'])
+                if not self._is_current_run(event):
+                    continue
+                yield format_sse(event)
+                if event['stage'] in TERMINAL_STAGES:
+                    return
+        finally:
+            await self.close()
+
+    async def close(self):
+        await self._pubsub.aclose()
+        await self._redis.aclose()
@@ -0,0 +1,22 @@
+import hashlib
+from typing import Optional
+
+
+def content_etag(body: bytes) -> str:
+    """
+    Strong ETag of a response body, it only changes with the content served to the client,
+    so writes to fields the response doesn't expose keep the cached copies of the clients valid.
+    """
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Evaluates an If-None-Match header against the current ETag, with the weak comparison of RFC 9110.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')]
+    return etag.removeprefix('W/') in candidates
@@ -1,43 +1,61 @@
 from typing import List, Optional
-from datetime import datetime
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, Header
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import Session, select, create_engine
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import tuple_, func, and_
+from sqlalchemy.orm import joinedload
 from celery.result import AsyncResult
+from redis import RedisError
 
+from backend.APIs.analysis_events import AnalysisEventStream
+from backend.APIs.conditional import content_etag, etag_matches
+from backend.APIs.responses import FastJSONResponse, rows_as_items
+from backend.APIs.pagination import encode_cursor, decode_cursor, encode_search_cursor, decode_search_cursor
 from backend.APIs.schemas import (
     JobSearchParamsInput,
     UserInstructionsInput,
     ResumeInput,
     Job,
     FilteredJob,
+    FilteredJobsPage,
+    JobSearchPage,
     JobSearchCountriesInput,
     JobSearchTitlesInput,
     JobAppliedInput,
     GetFilteredJobInput,
+    AnalysisRun,
+    UserProfileResponse,
 )
 from backend.linkedin.linkedin_wrapper import LinkedinWrapper
-from backend.database.models import JobAnalysis, AnalysisStatus
+from backend.database.models import JobAnalysis
 from backend.database.models import Job as JobTable
-from backend.database.utils import (
-    get_user,
-    insert_resume,
-    insert_user_instructions,
-    insert_user_job_search_countries,
-    insert_user_job_search_titles,
-    update_job_applied_status,
+from backend.database.models import AnalysisRun as AnalysisRunTable
+from backend.database.engine import engine
+from backend.database.utils import get_user, get_cached_user
+from backend.database.async_utils import (
+    get_async_db_session,
+    aget_user,
+    aget_cached_user,
+    ainsert_resume,
+    ainsert_user_instructions,
+    ainsert_user_job_search_countries,
+    ainsert_user_job_search_titles,
+    aupdate_job_applied_status,
 )
-from backend.queue.worker import analyze_jobs_task, celery_app
-from backend.constants import DATABASE_ENDPOINT
+from backend.queue.worker import enqueue_analysis, profile_resume_task, celery_app
 
 # TODO: implement authentication for the APIs
 
-db_engine = create_engine(DATABASE_ENDPOINT, echo=False)
-
 def get_db_session():
-    """Dependency for FastAPI Endpoints"""
-    with Session(db_engine) as session:
+    """
+    Sync dependency db session, for the sync endpoints that make blocking celery calls
+    and are therefore run in the threadpool.
+    """
+    with Session(engine) as session:
         yield session
 
 # --- App Definition ---
@@ -61,6 +79,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # the frontend revalidates the user profile with its ETag
+    expose_headers=["ETag"],
 )
 
 
@@ -142,28 +162,19 @@ def trigger_analysis(db_session: Session = Depends(get_db_session)):
         )
 
     # Prevent duplicate runs if one is already in progress
-    if user.analysis_task_id:
-        existing_task = AsyncResult(user.analysis_task_id, app=celery_app)
-        # blocked states: PENDING, STARTED, RETRY
-        if existing_task.state in {"PENDING", "STARTED", "RETRY"}:
-            raise HTTPException(
-                status_code=409,
-                detail="Analysis already running"
-            )
-
-    task = analyze_jobs_task.delay(user.email)
-    user.analysis_task_id = task.id
-    user.analysis_status = AnalysisStatus.IN_PROGRESS
-    user.analysis_started_at = datetime.utcnow()
-    db_session.add(user)
-    db_session.commit()
+    task_id = enqueue_analysis(user, db_session)
+    if task_id is None:
+        raise HTTPException(
+            status_code=409,
+            detail="Analysis already running"
+        )
 
-    return {"message": "Analysis started", "task_id": task.id}
+    return {"message": "Analysis started", "task_id": task_id}
 
 
 @app.get("/jobs/filter/status", response_model=dict, tags=["Jobs"])
 def get_analysis_status(db_session: Session = Depends(get_db_session)):
-    user = get_user(
+    user = get_cached_user(
         email="scoutling@scoutling.com",
         session=db_session
     )
@@ -185,17 +196,82 @@ def get_analysis_status(db_session: Session = Depends(get_db_session)):
         "started_at": user.analysis_started_at.isoformat() if user.analysis_started_at else None
     }
 
-@app.get("/jobs/filter", response_model=List[FilteredJob], tags=["Jobs"])
-def get_filtered_jobs(
+@app.get("/jobs/filter/events", tags=["Jobs"])
+async def stream_analysis_events(
+    request: Request,
+    db_session: AsyncSession = Depends(get_async_db_session)
+):
+    """
+    Server-Sent Events stream of the progress of the current analysis run:
+    the stage, the number of jobs crawled, inserted, shortlisted and found relevant, and the ETA of the agent stages.
+    The stream ends when the run completes or fails.
+    """
+    user = await aget_cached_user(
+        email="scoutling@scoutling.com",
+        session=db_session
+    )
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="User not found"
+        )
+
+    stream = AnalysisEventStream(user)
+    try:
+        await stream.connect()
+    except RedisError as e:
+        await stream.close()
+        raise HTTPException(status_code=503, detail=f"Analysis events are unavailable: {e}")
+
+    return StreamingResponse(
+        stream.events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/analysis/runs", response_model=List[AnalysisRun], tags=["Analysis"])
+async def get_analysis_runs(
     limit: int = 10,
-    offset: int = 0,
+    db_session: AsyncSession = Depends(get_async_db_session)
+):
+    """
+    Get the most recent analysis runs with their job counts and LLM token, latency and cost accounting.
+    """
+    user = await aget_cached_user(
+        email="scoutling@scoutling.com",
+        session=db_session
+    )
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="User not found"
+        )
+
+    statement = (
+        select(AnalysisRunTable)
+        .where(AnalysisRunTable.user_id == user.id)
+        .order_by(AnalysisRunTable.started_at.desc())
+        .limit(limit)
+    )
+    analysis_runs = (await db_session.exec(statement)).all()
+
+    return [AnalysisRun(**analysis_run.model_dump()) for analysis_run in analysis_runs]
+
+@app.get("/jobs/filter", response_model=FilteredJobsPage, tags=["Jobs"])
+async def get_filtered_jobs(
+    limit: int = Query(default=10, ge=1, le=50),
+    cursor: Optional[str] = None,
     relevant: Optional[bool] = None,
     applied: Optional[bool] = None,
-    db_session: Session = Depends(get_db_session)
+    db_session: AsyncSession = Depends(get_async_db_session)
 ):
+    """
+    Get a page of analyzed jobs, most recently analyzed first, without their descriptions.
+    Pass the `next_cursor` of a page as `cursor` to get the next page.
+    """
     # Assuming that the app is single user
 
-    user = get_user(
+    user = await aget_cached_user(
         email="scoutling@scoutling.com",
         session=db_session
     )
@@ -204,44 +280,190 @@ def get_filtered_jobs(
             status_code=404,
             detail="User not found"
         )
+    # the fields of FilteredJobSummary, the rows are serialised as they are
+    columns = (
+        JobTable.id,
+        JobTable.linkedin_job_id,
+        JobTable.title,
+        JobTable.company,
+        JobTable.location,
+        JobTable.url,
+        JobAnalysis.is_relevant.label("relevant"),
+        JobAnalysis.relevancy_reason,
+        JobAnalysis.applied,
+        JobAnalysis.analyzed_at,
+    )
+    statement = (
+        select(*columns, JobAnalysis.id.label("analysis_id"))
+        .join(JobAnalysis, JobAnalysis.job_id == JobTable.id)
+        .where(JobAnalysis.user_id == user.id)
+    )
+
+    if relevant is not None:
+        statement = statement.where(JobAnalysis.is_relevant == relevant)
+
+    if applied is not None:
+        statement = statement.where(JobAnalysis.applied == applied)
+
+    if cursor:
+        try:
+            cursor_analyzed_at, cursor_analysis_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        statement = statement.where(
+            tuple_(JobAnalysis.analyzed_at, JobAnalysis.id) < tuple_(cursor_analyzed_at, cursor_analysis_id)
+        )
+
+    # fetch one extra row to know whether there is a next page
+    statement = (
+        statement
+        .order_by(JobAnalysis.analyzed_at.desc(), JobAnalysis.id.desc())
+        .limit(limit + 1)
+    )
+
+    results = (await db_session.exec(statement)).all()
+
+    next_cursor = None
+    if len(results) > limit:
+        last_row = results[limit - 1]
+        next_cursor = encode_cursor(analyzed_at=last_row.analyzed_at, analysis_id=last_row.analysis_id)
+
+    # skips the validation of the rows against the response_model, see FastJSONResponse
+    return FastJSONResponse({
+        'items': rows_as_items(results[:limit], columns),
+        'next_cursor': next_cursor,
+    })
+
+@app.get("/job/analysis/{linkedin_job_id}", response_model=FilteredJob, tags=["Jobs"])
+async def get_filtered_job(
+    linkedin_job_id: str,
+    db_session: AsyncSession = Depends(get_async_db_session)
+):
+    """
+    Get an analyzed job with its full description.
+    """
+    user = await aget_cached_user(
+        email="scoutling@scoutling.com",
+        session=db_session
+    )
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="User not found"
+        )
+
     statement = (
         select(JobTable, JobAnalysis)
-        .join(JobAnalysis)
-        .where(JobAnalysis.job_id == JobTable.id)
+        .join(JobAnalysis, JobAnalysis.job_id == JobTable.id)
         .where(JobAnalysis.user_id == user.id)
+        .where(JobTable.linkedin_job_id == linkedin_job_id)
+        # the description can't be lazy loaded by the async session
+        .options(joinedload(JobTable.description_record))
+    )
+    result = (await db_session.exec(statement)).first()
+    if not result:
+        raise HTTPException(
+            status_code=404,
+            detail="Analyzed job not found"
+        )
+
+    job, analysis = result
+    return FilteredJob(
+        id=job.id,
+        linkedin_job_id=job.linkedin_job_id,
+        title=job.title,
+        company=job.company,
+        location=job.location,
+        url=job.url,
+        description=job.description,
+        relevant=analysis.is_relevant,
+        relevancy_reason=analysis.relevancy_reason,
+        applied=analysis.applied,
     )
 
+@app.get("/jobs/search", response_model=JobSearchPage, tags=["Jobs"])
+async def search_jobs(
+    q: str = Query(..., min_length=1, description="Search terms, supports quoted phrases, OR and -exclusions"),
+    limit: int = Query(default=10, ge=1, le=50),
+    cursor: Optional[str] = None,
+    analyzed: Optional[bool] = None,
+    relevant: Optional[bool] = None,
+    applied: Optional[bool] = None,
+    db_session: AsyncSession = Depends(get_async_db_session)
+):
+    """
+    Full-text search over the stored jobs, best matches first, without their descriptions.
+    The relevant and applied filters only match analyzed jobs.
+    Pass the `next_cursor` of a page as `cursor` to get the next page.
+    """
+    user = await aget_cached_user(
+        email="scoutling@scoutling.com",
+        session=db_session
+    )
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="User not found"
+        )
+
+    query = func.websearch_to_tsquery('english', q)
+    rank = func.ts_rank_cd(JobTable.search_vector, query)
+    # the fields of JobSearchResult, the rows are serialised as they are
+    columns = (
+        JobTable.id,
+        JobTable.linkedin_job_id,
+        JobTable.title,
+        JobTable.company,
+        JobTable.location,
+        JobTable.url,
+        JobTable.posted_at,
+        rank.label("rank"),
+        JobAnalysis.id.is_not(None).label("analyzed"),
+        JobAnalysis.is_relevant.label("relevant"),
+        JobAnalysis.relevancy_reason,
+        JobAnalysis.applied,
+    )
+    statement = (
+        select(*columns)
+        .outerjoin(JobAnalysis, and_(JobAnalysis.job_id == JobTable.id, JobAnalysis.user_id == user.id))
+        .where(JobTable.search_vector.op("@@")(query))
+    )
+
+    if analyzed is not None:
+        statement = statement.where(JobAnalysis.id.is_not(None) if analyzed else JobAnalysis.id.is_(None))
+
     if relevant is not None:
         statement = statement.where(JobAnalysis.is_relevant == relevant)
-    
+
     if applied is not None:
         statement = statement.where(JobAnalysis.applied == applied)
 
-    statement = statement.order_by(JobAnalysis.analyzed_at.desc())
-    
-    if limit:
-        statement = statement.limit(limit)
-    
-    if offset:
-        statement = statement.offset(offset)
-
-    results = db_session.exec(statement).all()
-    filtered_jobs = []
-    for job, analysis in results:
-        filtered_jobs.append(FilteredJob(
-            id=job.id,
-            linkedin_job_id=job.linkedin_job_id,
-            title=job.title,
-            company=job.company,
-            location=job.location,
-            url=job.url,
-            description=job.description,
-            relevant=analysis.is_relevant,
-            relevancy_reason=analysis.relevancy_reason,
-            applied=analysis.applied,
-        ))
-
-    return filtered_jobs
+    if cursor:
+        try:
+            cursor_rank, cursor_job_id = decode_search_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        statement = statement.where(tuple_(rank, JobTable.id) < tuple_(cursor_rank, cursor_job_id))
+
+    # fetch one extra row to know whether there is a next page
+    statement = (
+        statement
+        .order_by(rank.desc(), JobTable.id.desc())
+        .limit(limit + 1)
+    )
+
+    results = (await db_session.exec(statement)).all()
+
+    next_cursor = None
+    if len(results) > limit:
+        last_row = results[limit - 1]
+        next_cursor = encode_search_cursor(rank=last_row.rank, job_id=last_row.id)
+
+    # skips the validation of the rows against the response_model, see FastJSONResponse
+    return FastJSONResponse({
+        'items': rows_as_items(results[:limit], columns),
+        'next_cursor': next_cursor,
+    })
 
 @app.get("/job/details", response_model=Job, tags=["Jobs"])
 async def get_job_details(params: Job = Depends()):
@@ -256,11 +478,11 @@ async def get_job_details(params: Job = Depends()):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/job/applied", response_model=None, tags=["Jobs"])
-def mark_job_applied(
+async def mark_job_applied(
     params: JobAppliedInput,
-    db_session: Session = Depends(get_db_session)
+    db_session: AsyncSession = Depends(get_async_db_session)
 ):
-    user = get_user(
+    user = await aget_cached_user(
         email="scoutling@scoutling.com",
         session=db_session
     )
@@ -270,17 +492,55 @@ def mark_job_applied(
             detail="User not found"
         )
     
-    update_job_applied_status(
+    await aupdate_job_applied_status(
         user=user,
         linkedin_job_id=params.linkedin_job_id,
         applied=params.applied,
         session=db_session
     )
 
+@app.get("/user/profile", response_model=UserProfileResponse, tags=['User'])
+async def load_user_profile(
+          if_none_match: Optional[str] = Header(default=None),
+          db_session: AsyncSession = Depends(get_async_db_session)
+):
+    """
+    All the fields of the user profile in one response, with a strong ETag derived from the serialized profile.
+    Answers 304 without a body when the If-None-Match of the client matches the current version.
+    """
+    user = await aget_cached_user(
+        email="scoutling@scoutling.com",
+        session=db_session
+    )
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="User not found"
+        )
+
+    profile = UserProfileResponse(
+        name=user.name,
+        email=user.email,
+        resume=user.resume_text,
+        instructions=user.filter_instructions,
+        job_search_countries=user.job_countries,
+        job_search_titles=user.job_titles,
+    )
+    # rendered before the comparison, the ETag is the hash of the exact body served
+    response = FastJSONResponse(profile.model_dump(mode='json'))
+    etag = content_etag(response.body)
+    # no-cache: the client may store the profile but must revalidate it on every use
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return response
+
 @app.get("/user/instructions", response_model=str, tags=['User'])
-async def load_user_instructions(db_session: Session = Depends(get_db_session)):
+async def load_user_instructions(db_session: AsyncSession = Depends(get_async_db_session)):
     try:
-        user = get_user(
+        user = await aget_cached_user(
             email="scoutling@scoutling.com",
             session=db_session
         )
@@ -291,14 +551,14 @@ async def load_user_instructions(db_session: Session = Depends(get_db_session)):
 @app.post("/user/instructions", response_model=None, tags=['User'])
 async def save_user_instructions(
           params: UserInstructionsInput,
-          db_session: Session = Depends(get_db_session)
+          db_session: AsyncSession = Depends(get_async_db_session)
 ):
     try:
-        user = get_user(
+        user = await aget_user(
             email="scoutling@scoutling.com",
             session=db_session
         )
-        insert_user_instructions(
+        await ainsert_user_instructions(
             user=user,
             user_instructions=params.instructions,
             session=db_session
@@ -307,9 +567,9 @@ async def save_user_instructions(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/user/resume", response_model=str, tags=['User'])
-async def load_user_resume(db_session: Session = Depends(get_db_session)):
+async def load_user_resume(db_session: AsyncSession = Depends(get_async_db_session)):
     try:
-        user = get_user(
+        user = await aget_cached_user(
             email="scoutling@scoutling.com",
             session=db_session
         )
@@ -320,25 +580,27 @@ async def load_user_resume(db_session: Session = Depends(get_db_session)):
 @app.post("/user/resume", response_model=None, tags=['User'])
 async def save_user_resume(
           params: ResumeInput,
-          db_session: Session = Depends(get_db_session)
+          db_session: AsyncSession = Depends(get_async_db_session)
 ):
     try:
-        user = get_user(
+        user = await aget_user(
             email="scoutling@scoutling.com",
             session=db_session
         )
-        insert_resume(
+        await ainsert_resume(
             user=user,
             resume=params.resume,
             session=db_session
         )
+        # distill the resume once so the filterer doesn't receive the full resume for every job
+        await run_in_threadpool(profile_resume_task.delay, user.email)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/user/job_search_countries", response_model=List[str], tags=['User'])
-async def load_user_job_search_countries(db_session: Session = Depends(get_db_session)):
+async def load_user_job_search_countries(db_session: AsyncSession = Depends(get_async_db_session)):
     try:
-        user = get_user(
+        user = await aget_cached_user(
             email="scoutling@scoutling.com",
             session=db_session
         )
@@ -349,14 +611,14 @@ async def load_user_job_search_countries(db_session: Session = Depends(get_db_se
 @app.post("/user/job_search_countries", response_model=None, tags=['User'])
 async def save_user_job_search_countries(
           params: JobSearchCountriesInput,
-          db_session: Session = Depends(get_db_session)
+          db_session: AsyncSession = Depends(get_async_db_session)
 ):
     try:
-        user = get_user(
+        user = await aget_user(
             email="scoutling@scoutling.com",
             session=db_session
         )
-        insert_user_job_search_countries(
+        await ainsert_user_job_search_countries(
             user=user,
             job_search_countries=params.job_search_countries,
             session=db_session
@@ -365,9 +627,9 @@ async def save_user_job_search_countries(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/user/job_search_titles", response_model=List[str], tags=['User'])
-async def load_user_job_search_titles(db_session: Session = Depends(get_db_session)):
+async def load_user_job_search_titles(db_session: AsyncSession = Depends(get_async_db_session)):
     try:
-        user = get_user(
+        user = await aget_cached_user(
             email="scoutling@scoutling.com",
             session=db_session
         )
@@ -378,14 +640,14 @@ async def load_user_job_search_titles(db_session: Session = Depends(get_db_sessi
 @app.post("/user/job_search_titles", response_model=None, tags=['User'])
 async def save_user_job_search_titles(
           params: JobSearchTitlesInput,
-          db_session: Session = Depends(get_db_session)
+          db_session: AsyncSession = Depends(get_async_db_session)
 ):
     try:
-        user = get_user(
+        user = await aget_user(
             email="scoutling@scoutling.com",
             session=db_session
         )
-        insert_user_job_search_titles(
+        await ainsert_user_job_search_titles(
             user=user,
             job_search_titles=params.job_search_titles,
             session=db_session
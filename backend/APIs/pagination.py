@@ -0,0 +1,42 @@
+import base64
+from datetime import datetime
+from typing import Tuple
+
+
+def encode_cursor(analyzed_at: datetime, analysis_id: int) -> str:
+    """
+    Encodes the keyset of the last item of a page into an opaque cursor.
+    """
+    return base64.urlsafe_b64encode(f"{analyzed_at.isoformat()}|{analysis_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decodes a cursor into the (analyzed_at, analysis id) keyset it points after.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        analyzed_at, analysis_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(analyzed_at), int(analysis_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def encode_search_cursor(rank: float, job_id: int) -> str:
+    """
+    Encodes the keyset of the last search result of a page into an opaque cursor.
+    The rank is encoded with repr so that it decodes to the exact same float.
+    """
+    return base64.urlsafe_b64encode(f"{rank!r}|{job_id}".encode()).decode()
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    """
+    Decodes a search cursor into the (rank, job id) keyset it points after.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        rank, job_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return float(rank), int(job_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
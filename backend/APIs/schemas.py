@@ -1,4 +1,4 @@
-from typing import Optional, Literal, List
+from typing import Optional, Literal, List, Dict
 from datetime import datetime
 
 from pydantic import BaseModel, Field
@@ -17,6 +17,14 @@ class UserInstructionsInput(BaseModel):
 class ResumeInput(BaseModel):
     resume: str = Field(..., description="User's resume")
 
+class UserProfileResponse(BaseModel):
+    name: str
+    email: str
+    resume: str
+    instructions: str
+    job_search_countries: List[str]
+    job_search_titles: List[str]
+
 class JobSearchCountriesInput(BaseModel):
     job_search_countries: List[str] = Field(..., description="Job search countries")
 
@@ -39,6 +47,40 @@ class FilteredJob(Job):
     relevancy_reason: str
     applied: bool
 
+class FilteredJobSummary(BaseModel):
+    id: int
+    linkedin_job_id: str
+    title: str
+    url: str
+    company: Optional[str] = None
+    location: Optional[str] = None
+    relevant: bool
+    relevancy_reason: str
+    applied: bool
+    analyzed_at: datetime
+
+class FilteredJobsPage(BaseModel):
+    items: List[FilteredJobSummary]
+    next_cursor: Optional[str] = Field(default=None, description="Cursor of the next page, None on the last page")
+
+class JobSearchResult(BaseModel):
+    id: int
+    linkedin_job_id: str
+    title: str
+    url: str
+    company: Optional[str] = None
+    location: Optional[str] = None
+    posted_at: Optional[datetime] = None
+    rank: float = Field(..., description="Full-text search rank, higher is a better match")
+    analyzed: bool
+    relevant: Optional[bool] = None
+    relevancy_reason: Optional[str] = None
+    applied: Optional[bool] = None
+
+class JobSearchPage(BaseModel):
+    items: List[JobSearchResult]
+    next_cursor: Optional[str] = Field(default=None, description="Cursor of the next page, None on the last page")
+
 class JobAppliedInput(BaseModel):
     linkedin_job_id: str = Field(..., description="The LinkedIn Job ID")
     applied: bool = Field(..., description="The applied status")
@@ -50,3 +92,34 @@ class GetFilteredJobFilters(BaseModel):
 class GetFilteredJobInput(BaseModel):
     limit: int = Field(default=10, ge=1, le=50, description="Number of jobs to retrieve")
     filters: GetFilteredJobFilters = Field(default=None, description="The filters to retrieve analyzed jobs")
+
+class AnalysisRunStage(BaseModel):
+    calls: int
+    failed_calls: int
+    input_tokens: int
+    cached_input_tokens: int
+    output_tokens: int
+    llm_latency: float = Field(..., description="Summed latency of the LLM calls in seconds")
+    wall_time: float = Field(..., description="Time between the first and the last LLM call in seconds")
+    cost_usd: float
+    models: List[str]
+    prompt_version: Optional[str] = Field(default=None, description="Hash of the prompts and the config of the agent of the stage")
+
+class AnalysisRun(BaseModel):
+    id: int
+    task_id: Optional[str] = None
+    status: str
+    jobs_crawled: int
+    jobs_analyzed: int
+    jobs_relevant: int
+    jobs_inherited: int = Field(default=0, description="Jobs whose analysis was copied from an analyzed near-duplicate")
+    llm_calls: int
+    failed_llm_calls: int
+    input_tokens: int
+    cached_input_tokens: int
+    output_tokens: int
+    llm_latency: float
+    cost_usd: float
+    stages: Dict[str, AnalysisRunStage]
+    started_at: datetime
+    finished_at: Optional[datetime] = None
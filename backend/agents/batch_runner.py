@@ -0,0 +1,79 @@
+import asyncio
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from backend.config import logger
+
+
+async def abatch_with_retry(
+    chain: Runnable,
+    batch_inputs: List[Dict],
+    output_type: type,
+    stage: str,
+    max_retries: int = 2,
+    backoff_seconds: float = 2.0,
+    fallback_chain: Optional[Runnable] = None,
+    config: Optional[RunnableConfig] = None,
+) -> Tuple[List[Optional[Any]], List[int]]:
+    """
+    Runs the chain over the batch, capturing errors per item and re-submitting only the failed items.
+    An item fails if it raises or if its output is not an instance of `output_type`.
+
+    :param chain: the agent chain
+    :param batch_inputs: the inputs of the chain
+    :param output_type: the expected output type of the chain
+    :param stage: the name of the stage, used for logging
+    :param max_retries: the number of times the failed items are re-submitted to the chain
+    :param backoff_seconds: the base of the exponential backoff between the retries
+    :param fallback_chain: optional chain the items that still fail after the retries are submitted to once
+    :param config: the runnable config passed to the chains
+    :return: the outputs, None for the items that failed permanently, and the number of failures per item
+    """
+    outputs: List[Optional[Any]] = [None] * len(batch_inputs)
+    failure_counts = [0] * len(batch_inputs)
+    pending = list(range(len(batch_inputs)))
+
+    attempts = [chain] * (max_retries + 1)
+    if fallback_chain is not None:
+        attempts.append(fallback_chain)
+
+    for attempt, attempt_chain in enumerate(attempts):
+        if not pending:
+            break
+
+        if attempt > 0:
+            delay = backoff_seconds * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            fallback_note = " on the fallback model" if attempt_chain is fallback_chain else ""
+            logger.info(f"Retrying {len(pending)} failed {stage} items{fallback_note} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+        results = await attempt_chain.abatch(
+            [batch_inputs[i] for i in pending],
+            config=config,
+            return_exceptions=True,
+        )
+
+        still_pending = []
+        for i, result in zip(pending, results):
+            if isinstance(result, output_type):
+                outputs[i] = result
+                continue
+
+            failure_counts[i] += 1
+            still_pending.append(i)
+            if isinstance(result, Exception):
+                logger.warning(f"The {stage} failed for job {batch_inputs[i].get('job_id')}: {result!r}")
+            else:
+                logger.warning(f"The {stage} output for job {batch_inputs[i].get('job_id')} is not an instance of {output_type.__name__}")
+
+        pending = still_pending
+
+    n_retried = sum(1 for count in failure_counts if count)
+    if n_retried:
+        logger.info(f"{stage}: {n_retried} items failed at least once, {len(pending)} items failed permanently")
+    for i in pending:
+        logger.error(f"The {stage} failed permanently for job {batch_inputs[i].get('job_id')} after {failure_counts[i]} attempts")
+
+    return outputs, failure_counts
@@ -0,0 +1,155 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.messages.ai import UsageMetadata, add_usage
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel
+
+from backend.constants import MODEL_PRICES_PER_MILLION_TOKENS
+
+
+class LLMCallRecord(BaseModel):
+    model_name: Optional[str] = None
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+    latency: float = 0.0
+    started_at: float
+    ended_at: float
+    failed: bool = False
+
+
+def get_model_prices(model_name: Optional[str]) -> Optional[dict]:
+    """
+    Returns the prices of the model, matching dated model versions (e.g. 'gpt-5-mini-2025-08-07') by prefix.
+    """
+    if not model_name:
+        return None
+    matches = [name for name in MODEL_PRICES_PER_MILLION_TOKENS if model_name.startswith(name)]
+    if not matches:
+        return None
+    return MODEL_PRICES_PER_MILLION_TOKENS[max(matches, key=len)]
+
+
+def compute_cost(record: LLMCallRecord) -> float:
+    """
+    Computes the cost of the call in USD, 0 for models without known prices.
+    """
+    prices = get_model_prices(record.model_name)
+    if not prices:
+        return 0.0
+    uncached_input_tokens = record.input_tokens - record.cached_input_tokens
+    return (
+        uncached_input_tokens * prices['input']
+        + record.cached_input_tokens * prices['cached_input']
+        + record.output_tokens * prices['output']
+    ) / 1_000_000
+
+
+class LLMCallTracker(BaseCallbackHandler):
+    """
+    Callback handler that records the tokens, latency and model of every LLM call of an agent stage.
+    Pass it in the callbacks of the chain config, it is inherited by the chat model runs of the chain.
+    """
+
+    run_inline = True
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.calls: List[LLMCallRecord] = []
+        self._starts: Dict[UUID, tuple[float, Optional[str]]] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[BaseMessage]],
+        *,
+        run_id: UUID,
+        invocation_params: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> Any:
+        model_name = (invocation_params or {}).get('model') or (invocation_params or {}).get('model_name')
+        with self._lock:
+            self._starts[run_id] = (time.perf_counter(), model_name)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> Any:
+        ended_at = time.perf_counter()
+        with self._lock:
+            started_at, model_name = self._starts.pop(run_id, (ended_at, None))
+
+        usage: Optional[UsageMetadata] = None
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, 'message', None)
+                if message is None:
+                    continue
+                if getattr(message, 'usage_metadata', None):
+                    usage = add_usage(usage, message.usage_metadata)
+                model_name = message.response_metadata.get('model_name') or model_name
+
+        usage = usage or {}
+        record = LLMCallRecord(
+            model_name=model_name,
+            input_tokens=usage.get('input_tokens', 0),
+            cached_input_tokens=usage.get('input_token_details', {}).get('cache_read', 0),
+            output_tokens=usage.get('output_tokens', 0),
+            latency=ended_at - started_at,
+            started_at=started_at,
+            ended_at=ended_at,
+        )
+        with self._lock:
+            self.calls.append(record)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        ended_at = time.perf_counter()
+        with self._lock:
+            started_at, model_name = self._starts.pop(run_id, (ended_at, None))
+            self.calls.append(LLMCallRecord(
+                model_name=model_name,
+                latency=ended_at - started_at,
+                started_at=started_at,
+                ended_at=ended_at,
+                failed=True,
+            ))
+
+    @property
+    def usage_metadata(self) -> dict[str, UsageMetadata]:
+        """
+        The usage metadata per model, in the format of langchain's UsageMetadataCallbackHandler.
+        """
+        usage_per_model: dict[str, UsageMetadata] = {}
+        for call in self.calls:
+            if call.failed:
+                continue
+            usage = UsageMetadata(
+                input_tokens=call.input_tokens,
+                output_tokens=call.output_tokens,
+                total_tokens=call.input_tokens + call.output_tokens,
+                input_token_details={'cache_read': call.cached_input_tokens},
+            )
+            model_name = call.model_name or 'unknown'
+            usage_per_model[model_name] = add_usage(usage_per_model.get(model_name), usage)
+        return usage_per_model
+
+    def summary(self) -> dict:
+        """
+        Aggregates the calls of the stage.
+        :return: the number of calls, tokens, latency, wall time and cost of the stage
+        """
+        calls = list(self.calls)
+        return {
+            'calls': len(calls),
+            'failed_calls': sum(1 for call in calls if call.failed),
+            'input_tokens': sum(call.input_tokens for call in calls),
+            'cached_input_tokens': sum(call.cached_input_tokens for call in calls),
+            'output_tokens': sum(call.output_tokens for call in calls),
+            'llm_latency': sum(call.latency for call in calls),
+            'wall_time': max(call.ended_at for call in calls) - min(call.started_at for call in calls) if calls else 0.0,
+            'cost_usd': sum(compute_cost(call) for call in calls),
+            'models': sorted({call.model_name for call in calls if call.model_name}),
+        }
@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+import uuid
+from typing import Any, List, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field, PrivateAttr
+
+# average number of characters per token, used to fake the usage metadata
+CHARS_PER_TOKEN = 4
+
+
+class FakeLLMError(RuntimeError):
+    """Error raised by the fake chat model to simulate a failed call."""
+
+
+class FakeCallRecorder:
+    """
+    Records the start and end time of every fake chat model call of the process, used by the benchmarks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: List[tuple[float, float, bool]] = []
+
+    def record(self, start: float, end: float, succeeded: bool):
+        with self._lock:
+            self.calls.append((start, end, succeeded))
+
+    def reset(self):
+        with self._lock:
+            self.calls = []
+
+
+fake_call_recorder = FakeCallRecorder()
+
+
+def fake_value(schema: dict, name: str, rng: random.Random) -> Any:
+    """
+    Builds a deterministic value that satisfies the given JSON schema.
+    """
+    if 'enum' in schema:
+        return rng.choice(schema['enum'])
+    if 'anyOf' in schema:
+        options = [option for option in schema['anyOf'] if option.get('type') != 'null']
+        return fake_value(options[0], name, rng) if options else None
+
+    schema_type = schema.get('type')
+    if schema_type == 'object':
+        return {
+            key: fake_value(value, key, rng)
+            for key, value in schema.get('properties', {}).items()
+        }
+    if schema_type == 'array':
+        return [fake_value(schema.get('items', {}), name, rng) for _ in range(rng.randint(1, 3))]
+    if schema_type == 'integer':
+        return rng.randint(0, 10)
+    if schema_type == 'number':
+        return round(rng.uniform(0, 10), 2)
+    if schema_type == 'boolean':
+        return rng.random() < 0.5
+    return f"fake {name}"
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline chat model with a configurable per-call latency and failure rate.
+    The outputs are derived from the hash of the prompt, so the same prompt always gets the same output.
+    Structured outputs are supported through fake tool calls that satisfy the requested schema.
+    """
+
+    model_name: str = Field(default='fake')
+    latency: float = Field(default=0.5, description="The mean latency of a call in seconds")
+    latency_jitter: float = Field(default=0.2, description="The relative jitter of the latency")
+    failure_rate: float = Field(default=0.0, description="The probability of a call failing")
+    output_tokens: int = Field(default=30, description="The number of output tokens reported per call")
+    seed: int = Field(default=0)
+
+    _rng: random.Random = PrivateAttr()
+
+    def model_post_init(self, context: Any):
+        # failures are drawn from a process wide generator so that retried prompts can succeed
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake-chat-model'
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {'model_name': self.model_name}
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _prompt_rng(self, messages: List[BaseMessage]) -> random.Random:
+        prompt = '\n'.join(str(message.content) for message in messages)
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode('utf-8')).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+
+    def _call_latency(self) -> float:
+        return max(0.0, self.latency * (1 + self._rng.uniform(-self.latency_jitter, self.latency_jitter)))
+
+    def _build_result(self, messages: List[BaseMessage], tools: Optional[List[dict]]) -> ChatResult:
+        rng = self._prompt_rng(messages)
+        input_tokens = sum(len(str(message.content)) for message in messages) // CHARS_PER_TOKEN
+        usage_metadata = {
+            'input_tokens': input_tokens,
+            'output_tokens': self.output_tokens,
+            'total_tokens': input_tokens + self.output_tokens,
+            'input_token_details': {'cache_read': 0},
+        }
+
+        if tools:
+            function = tools[0]['function']
+            message = AIMessage(
+                content='',
+                tool_calls=[{
+                    'name': function['name'],
+                    'args': fake_value(function.get('parameters', {}), function['name'], rng),
+                    'id': f"call_{uuid.UUID(int=rng.getrandbits(128)).hex}",
+                }],
+                usage_metadata=usage_metadata,
+                response_metadata={'model_name': self.model_name},
+            )
+        else:
+            message = AIMessage(
+                content=f"fake response {rng.getrandbits(32)}",
+                usage_metadata=usage_metadata,
+                response_metadata={'model_name': self.model_name},
+            )
+
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        start = time.perf_counter()
+        time.sleep(self._call_latency())
+        failed = self._rng.random() < self.failure_rate
+        fake_call_recorder.record(start, time.perf_counter(), not failed)
+        if failed:
+            raise FakeLLMError("Simulated failure of the fake chat model")
+        return self._build_result(messages, kwargs.get('tools'))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        start = time.perf_counter()
+        await asyncio.sleep(self._call_latency())
+        failed = self._rng.random() < self.failure_rate
+        fake_call_recorder.record(start, time.perf_counter(), not failed)
+        if failed:
+            raise FakeLLMError("Simulated failure of the fake chat model")
+        return self._build_result(messages, kwargs.get('tools'))
@@ -0,0 +1,176 @@
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import tiktoken
+
+from backend.config import logger
+
+DEFAULT_ENCODING = 'o200k_base'
+
+# average number of characters per token, used only when no tokenizer encoding can be loaded
+APPROX_CHARS_PER_TOKEN = 4
+
+# headings of description sections that carry no signal about the role itself
+BOILERPLATE_HEADING_PATTERN = re.compile(
+    r"^\W*("
+    r"benefits|perks|what we offer|what you(?:'ll| will) get|why join|why work|our offer|we offer"
+    r"|about (?:us|the company|the team at|our company)|who we are|our story|our mission|company overview"
+    r"|equal (?:employment )?opportunit|eeo|diversity|inclusion|accommodation|privacy|data protection"
+    r"|how to apply|application process|recruitment process|disclaimer"
+    r")",
+    re.IGNORECASE,
+)
+
+# headings of the sections about the role, they end a boilerplate section
+ROLE_HEADING_PATTERN = re.compile(
+    r"(?:about|the) (?:the )?(?:role|job|position)|job description|role description|the opportunity"
+    r"|(?:key |main |your )?(?:responsibilities|tasks|duties)|what you(?:'ll| will) do|your (?:role|mission|impact)"
+    r"|(?:minimum |preferred |basic )?(?:requirements|qualifications)|your profile|who you are|what you bring"
+    r"|what we(?:'re| are) looking for|(?:required |technical )?skills|experience|nice to have|bonus points"
+    r"|(?:our )?tech(?:nology)? stack|compensation|salary|location|working hours",
+    re.IGNORECASE,
+)
+
+# markup around a heading, e.g. markdown headers and bold, and its trailing colon
+HEADING_MARKUP_PATTERN = re.compile(r"^[\s#*_]+|[\s#*_:]+$")
+
+# list items start with a bullet or a number, they are never headings
+LIST_ITEM_PATTERN = re.compile(r"^(?:[-*•·]|\d+[.)])\s")
+
+# words that stay lowercase in a title case heading
+TITLE_CASE_MINOR_WORDS = {'a', 'an', 'and', 'at', 'for', 'in', 'of', 'on', 'or', 'the', 'to', 'with', '&'}
+
+# standalone paragraphs that are boilerplate regardless of the section they appear in
+BOILERPLATE_PARAGRAPH_PATTERN = re.compile(
+    r"equal opportunity employer|without regard to (?:race|age|gender)|reasonable accommodation"
+    r"|applicant privacy|privacy (?:notice|policy)|e-verify|background check",
+    re.IGNORECASE,
+)
+
+MAX_HEADING_LENGTH = 80
+# a known boilerplate name starts a heading of at most this many words, longer lines are sentences
+MAX_HEADING_WORDS = 6
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: Optional[str] = None) -> Optional[tiktoken.Encoding]:
+    """
+    Returns the tokenizer encoding of the given model, falls back to the default encoding for unknown models.
+    Returns None if the encoding cannot be loaded (e.g. no access to the encoding files).
+    """
+    try:
+        if model_name:
+            try:
+                return tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        logger.warning(f"Could not load the tokenizer encoding, approximating token counts: {e}")
+        return None
+
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    """
+    Counts the number of tokens of the text for the given model.
+    """
+    if not text:
+        return 0
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return -(-len(text) // APPROX_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model_name: Optional[str] = None) -> str:
+    """
+    Truncates the text to at most `max_tokens` tokens.
+    """
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return text[:max_tokens * APPROX_CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def _heading_text(line: str) -> str:
+    return HEADING_MARKUP_PATTERN.sub('', line.strip())
+
+
+def _is_title_case(text: str) -> bool:
+    first_word, *words = text.split()
+    return first_word[0].isupper() and all(
+        word[0].isupper() or not word[0].isalpha() or word in TITLE_CASE_MINOR_WORDS for word in words
+    )
+
+
+def _is_heading(line: str) -> bool:
+    """
+    Whether the line is a section heading: it ends with a colon, is a known section name or is in title case.
+    Short lines alone are not headings, e.g. the items of a list or a one line sentence without a period.
+    """
+    line = line.strip()
+    if not 0 < len(line) <= MAX_HEADING_LENGTH or line.endswith('.') or LIST_ITEM_PATTERN.match(line):
+        return False
+    if line.endswith(':'):
+        return True
+    text = _heading_text(line)
+    if not text:
+        return False
+    if ROLE_HEADING_PATTERN.fullmatch(text):
+        return True
+    if len(text.split()) <= MAX_HEADING_WORDS and BOILERPLATE_HEADING_PATTERN.match(text):
+        return True
+    return _is_title_case(text)
+
+
+def remove_boilerplate(description: str) -> str:
+    """
+    Removes the boilerplate sections (benefits, EEO statements, company blurb, ...) from a job description.
+    The description is split into paragraphs, a paragraph that starts with a boilerplate heading marks the
+    start of a boilerplate section which lasts until the next paragraph that starts with another heading.
+    """
+    kept_paragraphs: List[str] = []
+    in_boilerplate_section = False
+    for paragraph in description.split('\n\n'):
+        first_line = paragraph.strip().split('\n', 1)[0]
+        if _is_heading(first_line):
+            in_boilerplate_section = bool(BOILERPLATE_HEADING_PATTERN.match(_heading_text(first_line)))
+
+        if in_boilerplate_section or BOILERPLATE_PARAGRAPH_PATTERN.search(paragraph):
+            continue
+        kept_paragraphs.append(paragraph)
+
+    return '\n\n'.join(kept_paragraphs)
+
+
+def fit_to_budget(
+    text: str,
+    max_tokens: Optional[int],
+    model_name: Optional[str] = None,
+    strip_boilerplate: bool = True,
+) -> Tuple[str, int]:
+    """
+    Fits the text into the token budget. Boilerplate sections are dropped first,
+    then the text is truncated if it still does not fit.
+    :param text: the text to fit
+    :param max_tokens: the token budget, None means no budget
+    :param model_name: the name of the model the text is sent to
+    :param strip_boilerplate: whether to drop boilerplate sections before truncating
+    :return: the fitted text and the number of tokens saved
+    """
+    if not text or max_tokens is None:
+        return text, 0
+
+    original_tokens = count_tokens(text, model_name)
+    if original_tokens <= max_tokens:
+        return text, 0
+
+    if strip_boilerplate:
+        text = remove_boilerplate(text)
+
+    fitted_text = truncate_to_tokens(text, max_tokens, model_name)
+    return fitted_text, original_tokens - count_tokens(fitted_text, model_name)
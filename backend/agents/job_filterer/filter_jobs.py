@@ -1,9 +1,16 @@
 import asyncio
 import json
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 
 from backend.linkedin.linkedin_wrapper import Job
-from backend.agents.job_filterer.agent import instantiate_job_filterer, build_batch_inputs, JobFiltererOutput
+from backend.agents.job_filterer.agent import (
+    job_filterer,
+    build_batch_inputs,
+    JobFiltererOutput
+)
+from backend.agents.batch_runner import abatch_with_retry
+from backend.agents.call_tracker import LLMCallTracker
+from backend.utils import log_prompt_cache_usage
 from backend.config import logger
 
 
@@ -11,30 +18,56 @@ async def filter_jobs(
           jobs: List[Job],
           user_instructions: str,
           resume: str,
-) -> Tuple[List[Job], List[str]]:
-
-
-    filterer = instantiate_job_filterer()
+          call_tracker: Optional[LLMCallTracker] = None,
+) -> Tuple[List[Job], List[str], List[Job]]:
+    """
+    :return: the relevant jobs, their relevancy reasons and the discarded jobs,
+        the jobs whose calls failed permanently are in neither
+    """
+
+    if call_tracker is None:
+        call_tracker = LLMCallTracker(stage='job_filterer')
+    # the chains are built once per process and rebuilt when the prompts or the config change
+    agent_config = job_filterer.config()
+    filterer = job_filterer.chain()
+    fallback_filterer = None
+    if agent_config.get('fallback_llm'):
+        fallback_filterer = job_filterer.chain(llm='fallback_llm')
+    retry_config = agent_config.get('retry') or {}
     batch_inputs = build_batch_inputs(
         jobs=jobs,
         user_instructions=user_instructions,
-        resume=resume
+        resume=resume,
+        agent_config=agent_config,
+    )
+    outputs, _ = await abatch_with_retry(
+        chain=filterer,
+        batch_inputs=batch_inputs,
+        output_type=JobFiltererOutput,
+        stage='job_filterer',
+        max_retries=retry_config.get('max_retries', 2),
+        backoff_seconds=retry_config.get('backoff_seconds', 2),
+        fallback_chain=fallback_filterer,
+        config={'callbacks': [call_tracker]},
     )
-    outputs: List[JobFiltererOutput] = await filterer.abatch(batch_inputs)
+    log_prompt_cache_usage(stage='job_filterer', usage_metadata=call_tracker.usage_metadata)
 
     filtered_jobs = []
     relevancy_reasons = []
+    discarded_jobs = []
     for output, job in zip(outputs, jobs):
 
-        if not isinstance(output, JobFiltererOutput):
-            logger.warning("The job filterer output is not an instance of JobFiltererOutput")
+        # failed permanently, already logged by abatch_with_retry
+        if output is None:
             continue
 
         if output.decision == 'KEEP':
             filtered_jobs.append(job)
             relevancy_reasons.append(output.relevancy_reason)
+        else:
+            discarded_jobs.append(job)
 
-    return filtered_jobs, relevancy_reasons
+    return filtered_jobs, relevancy_reasons, discarded_jobs
 
 async def main():
     # mock jobs
@@ -53,7 +86,7 @@ async def main():
     shortlisted_jobs = jobs[:5]
     logger.info(f"Finished short listing jobs. {len(shortlisted_jobs)} jobs got shortlisted")
 
-    filtered_jobs = await filter_jobs(shortlisted_jobs, user_instructions, resume)
+    filtered_jobs, _, _ = await filter_jobs(shortlisted_jobs, user_instructions, resume)
 
 
 if __name__ == '__main__':
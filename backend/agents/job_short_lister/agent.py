@@ -6,6 +6,9 @@ from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 
 from backend.utils import llm_factory
+from backend.agents.input_budget import fit_to_budget
+from backend.agents.registry import agent_registry
+from backend.config import logger
 from backend.linkedin.linkedin_wrapper import Job
 
 MODULE_DIR = Path(__file__).resolve().parent
@@ -36,36 +39,69 @@ def load_user_prompt(path: str = None) -> str:
     with open(path, "r") as f:
         return f.read()
 
-def extract_brief_job_description(description: str) -> str:
-    return '\n\n'.join(description.split('\n\n')[:9])
-
-def build_batch_inputs(jobs: List[Job], user_instructions: str) -> List[Dict]:
+def build_batch_inputs(
+    jobs: List[Job],
+    user_instructions: str,
+    agent_config: dict = None,
+) -> List[Dict]:
+    """
+    Builds the short lister inputs, the job brief is the description fitted into the token budget of the config.
+    """
+    if agent_config is None:
+        agent_config = job_short_lister.config()
+    model_name = agent_config['llm']['model_name']
+    input_budget = agent_config.get('input_budget') or {}
+
+    tokens_saved = 0
     batch_inputs = []
     for job in jobs:
+        job_brief, brief_tokens_saved = fit_to_budget(
+            text=job.description or '',
+            max_tokens=input_budget.get('job_brief'),
+            model_name=model_name,
+        )
+        tokens_saved += brief_tokens_saved
         batch_inputs.append(
             {
                 'job_title': str(job.title),
-                'job_brief': str(extract_brief_job_description(job.description)),
+                'job_brief': job_brief,
                 'user_instructions': user_instructions,
                 'job_id': job.id,
             }
         )
 
+    logger.info(f"Job short lister input budgeting saved {tokens_saved} tokens over {len(jobs)} jobs")
     return batch_inputs
 
-# TODO: handle input size
-def instantiate_job_short_lister():
-
-    agent_config = load_config()
-    llm = llm_factory(**agent_config.get('llm'))
+def instantiate_job_short_lister(
+    agent_config: dict = None,
+    llm_config: dict = None,
+    system_prompt: str = None,
+    user_prompt: str = None,
+):
+    """
+    Builds the agent chain, use `job_short_lister.chain()` to reuse the chain built by the registry instead.
+    :param agent_config: the agent config, loaded from config.yml if not given
+    :param llm_config: the llm config, defaults to the llm of the agent config
+    :param system_prompt: the system prompt, loaded from system_prompt.md if not given
+    :param user_prompt: the user prompt, loaded from user_prompt.txt if not given
+    :return:
+    """
+    if agent_config is None:
+        agent_config = load_config()
+    if llm_config is None:
+        llm_config = agent_config.get('llm')
+    llm = llm_factory(model_name=llm_config['model_name'], kwargs=dict(llm_config.get('kwargs') or {}))
 
     if not agent_config.get('streaming'):
         llm.disable_streaming = True
 
-    sys_prompt = load_system_prompt()
-    user_prompt = load_user_prompt()
+    if system_prompt is None:
+        system_prompt = load_system_prompt()
+    if user_prompt is None:
+        user_prompt = load_user_prompt()
     prompt_template = ChatPromptTemplate.from_messages([
-        ('system', sys_prompt),
+        ('system', system_prompt),
         ('human', user_prompt)
     ])
 
@@ -73,4 +109,6 @@ def instantiate_job_short_lister():
         structured_llm = llm.with_structured_output(JobShortListerOutput)
         return prompt_template | structured_llm
 
-    return prompt_template | llm
\ No newline at end of file
+    return prompt_template | llm
+
+job_short_lister = agent_registry.register(name='job_short_lister', directory=MODULE_DIR, build=instantiate_job_short_lister)
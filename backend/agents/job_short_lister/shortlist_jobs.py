@@ -1,41 +1,68 @@
 import json
 import asyncio
-from typing import List
+from typing import List, Optional, Tuple
 
 from backend.agents.job_short_lister.agent import (
-    instantiate_job_short_lister,
+    job_short_lister,
     build_batch_inputs,
     JobShortListerOutput
 )
 from backend.linkedin.linkedin_wrapper import Job
+from backend.agents.batch_runner import abatch_with_retry
+from backend.agents.call_tracker import LLMCallTracker
+from backend.utils import log_prompt_cache_usage
 from backend.config import logger
 
 async def shortlist_jobs(
           jobs: List[Job],
           user_instructions: str,
-) -> List[Job]:
+          call_tracker: Optional[LLMCallTracker] = None,
+) -> Tuple[List[Job], List[Job]]:
+    """
+    :return: the short listed jobs and the discarded jobs, the jobs whose calls failed permanently are in neither
+    """
 
-
-    short_lister = instantiate_job_short_lister()
+    if call_tracker is None:
+        call_tracker = LLMCallTracker(stage='job_short_lister')
+    # the chains are built once per process and rebuilt when the prompts or the config change
+    agent_config = job_short_lister.config()
+    short_lister = job_short_lister.chain()
+    fallback_short_lister = None
+    if agent_config.get('fallback_llm'):
+        fallback_short_lister = job_short_lister.chain(llm='fallback_llm')
+    retry_config = agent_config.get('retry') or {}
     batch_inputs = build_batch_inputs(
         jobs=jobs,
         user_instructions=user_instructions,
+        agent_config=agent_config,
+    )
+    outputs, _ = await abatch_with_retry(
+        chain=short_lister,
+        batch_inputs=batch_inputs,
+        output_type=JobShortListerOutput,
+        stage='job_short_lister',
+        max_retries=retry_config.get('max_retries', 2),
+        backoff_seconds=retry_config.get('backoff_seconds', 2),
+        fallback_chain=fallback_short_lister,
+        config={'callbacks': [call_tracker]},
     )
-    outputs = await short_lister.abatch(batch_inputs)
+    log_prompt_cache_usage(stage='job_short_lister', usage_metadata=call_tracker.usage_metadata)
 
     short_listed_jobs = []
+    discarded_jobs = []
     for output, job in zip(outputs, jobs):
 
-        if not isinstance(output, JobShortListerOutput):
-            logger.warning("The job short lister output is not an instance of JobShortListerOutput")
+        # failed permanently, already logged by abatch_with_retry
+        if output is None:
             continue
 
         if output.decision == 'DISCARD':
+            discarded_jobs.append(job)
             continue
 
         short_listed_jobs.append(job)
 
-    return short_listed_jobs
+    return short_listed_jobs, discarded_jobs
 
 async def main():
     with open('../../jobs.json') as f:
@@ -45,7 +72,7 @@ async def main():
     user_instructions = """I'm looking for Machine Learning Engineer, AI Engineer, Data scientist or positions very similar to these"""
 
     logger.info(f"Starting to short list {len(jobs)} jobs")
-    shortlisted_jobs = await shortlist_jobs(jobs[:2], user_instructions)
+    shortlisted_jobs, _ = await shortlist_jobs(jobs[:2], user_instructions)
     logger.info(f"Finished short listing jobs. {len(shortlisted_jobs)} jobs got shortlisted")
 
 if __name__ == '__main__':
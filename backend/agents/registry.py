@@ -0,0 +1,187 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import yaml
+from langchain_core.runnables import Runnable
+
+from backend.config import logger
+
+# the files of an agent folder, a change of any of them rebuilds the chains of the agent
+CONFIG_FILE = 'config.yml'
+SYSTEM_PROMPT_FILE = 'system_prompt.md'
+USER_PROMPT_FILE = 'user_prompt.txt'
+AGENT_FILES = (CONFIG_FILE, SYSTEM_PROMPT_FILE, USER_PROMPT_FILE)
+
+
+class RegisteredAgent:
+    """
+    An agent of the registry, builds its chains once per process and reuses them, together with their LLM clients
+    and HTTP connection pools, until a file of the agent folder changes.
+
+    The files are checked on every access: a file is only re-read if its mtime or size changed,
+    and the chains are only rebuilt if its content hash changed.
+    The async LLM clients are bound to the event loop they were first used on,
+    so a chain is also rebuilt when it is used on another event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        directory: Path,
+        build: Callable[[dict, dict, str, str], Runnable],
+    ):
+        """
+        :param name: the name of the agent, the name of its stage in the LLM call trackers
+        :param directory: the agent folder, holding its config.yml, system_prompt.md and user_prompt.txt
+        :param build: builds the chain from the agent config, the llm config, the system prompt and the user prompt
+        """
+        self.name = name
+        self.directory = directory
+        self.build = build
+        self._lock = threading.RLock()
+        # file name -> (mtime_ns, size) and content hash of the last read
+        self._stats: Dict[str, tuple[int, int]] = {}
+        self._hashes: Dict[str, str] = {}
+        self._contents: Dict[str, str] = {}
+        self._config: Optional[dict] = None
+        self._overrides: Dict[str, Any] = {}
+        self._version: Optional[str] = None
+        # llm config key -> (event loop the chain was built for, chain)
+        self._chains: Dict[str, tuple[Optional[weakref.ref], Runnable]] = {}
+
+    def _refresh(self):
+        with self._lock:
+            changed = self._version is None
+            for file_name in AGENT_FILES:
+                path = self.directory / file_name
+                stat = os.stat(path)
+                file_stat = (stat.st_mtime_ns, stat.st_size)
+                if self._stats.get(file_name) == file_stat:
+                    continue
+                self._stats[file_name] = file_stat
+
+                with open(path, 'r') as f:
+                    content = f.read()
+                content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+                if self._hashes.get(file_name) != content_hash:
+                    self._hashes[file_name] = content_hash
+                    self._contents[file_name] = content
+                    changed = True
+
+            if changed:
+                self._invalidate()
+
+    def _invalidate(self):
+        if self._version is not None:
+            logger.info(f"The files of the agent {self.name} changed, rebuilding its chains")
+        self._config = {**yaml.safe_load(self._contents[CONFIG_FILE]), **self._overrides}
+        version_parts = [self._hashes[file_name] for file_name in AGENT_FILES]
+        version_parts.append(json.dumps(self._overrides, sort_keys=True, default=str))
+        self._version = hashlib.sha256('|'.join(version_parts).encode('utf-8')).hexdigest()[:16]
+        self._chains.clear()
+
+    def config(self) -> dict:
+        """
+        :return: a copy of the agent config, free to modify
+        """
+        self._refresh()
+        with self._lock:
+            return copy.deepcopy(self._config)
+
+    def prompt_version(self) -> str:
+        """
+        Short hash of the prompts and the config of the agent,
+        which changes whenever the agent may produce different outputs for the same inputs.
+        """
+        self._refresh()
+        with self._lock:
+            return self._version
+
+    def chain(self, llm: str = 'llm') -> Runnable:
+        """
+        :param llm: the key of the llm config in the agent config, e.g. 'fallback_llm'
+        :return: the chain of the agent on that llm
+        """
+        self._refresh()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        with self._lock:
+            entry = self._chains.get(llm)
+            if entry is not None:
+                loop_ref, chain = entry
+                # the sync callers only reuse the chains built without a loop,
+                # not the ones whose loop was garbage collected since
+                if loop is None:
+                    reusable = loop_ref is None
+                else:
+                    reusable = loop_ref is not None and loop_ref() is loop
+                if reusable:
+                    return chain
+
+            agent_config = copy.deepcopy(self._config)
+            chain = self.build(
+                agent_config,
+                agent_config[llm],
+                self._contents[SYSTEM_PROMPT_FILE],
+                self._contents[USER_PROMPT_FILE],
+            )
+            self._chains[llm] = (weakref.ref(loop) if loop else None, chain)
+            return chain
+
+    @contextmanager
+    def override_config(self, **overrides):
+        """
+        Overrides top-level keys of the agent config within the context, e.g. to run the agent on a fake llm.
+        """
+        with self._lock:
+            previous_overrides = self._overrides
+            self._overrides = {**previous_overrides, **overrides}
+            self._version = None
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._overrides = previous_overrides
+                self._version = None
+
+
+class AgentRegistry:
+    """
+    The agents of the process, keyed by name.
+    """
+
+    def __init__(self):
+        self._agents: Dict[str, RegisteredAgent] = {}
+
+    def register(
+        self,
+        name: str,
+        directory: Path,
+        build: Callable[[dict, dict, str, str], Runnable],
+    ) -> RegisteredAgent:
+        agent = RegisteredAgent(name=name, directory=directory, build=build)
+        self._agents[name] = agent
+        return agent
+
+    def get(self, name: str) -> Optional[RegisteredAgent]:
+        return self._agents.get(name)
+
+    def prompt_versions(self) -> Dict[str, str]:
+        """
+        :return: the prompt version of every registered agent
+        """
+        return {name: agent.prompt_version() for name, agent in self._agents.items()}
+
+
+agent_registry = AgentRegistry()
@@ -0,0 +1,122 @@
+import yaml
+import hashlib
+from pathlib import Path
+from typing import List, Optional
+
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, Field
+
+from backend.utils import llm_factory
+from backend.agents.registry import agent_registry
+
+MODULE_DIR = Path(__file__).resolve().parent
+
+class ResumeProfile(BaseModel):
+    skills: List[str] = Field(
+        description="The most important skills, tools and technologies of the user, at most 30."
+    )
+    seniority: str = Field(
+        description="The seniority level of the user, e.g. 'Student', 'Junior', 'Mid', 'Senior', 'Lead'."
+    )
+    years_of_experience: Optional[int] = Field(
+        default=None,
+        description="The years of professional experience, if it can be derived from the resume."
+    )
+    roles: List[str] = Field(
+        description="The job titles the user held."
+    )
+    domains: List[str] = Field(
+        description="The industries and domains the user worked in."
+    )
+    languages: List[str] = Field(
+        description="The spoken languages of the user with their proficiency, e.g. 'English (fluent)'."
+    )
+    hard_constraints: List[str] = Field(
+        description="Hard constraints stated in the resume, e.g. location, work permit or availability."
+    )
+
+# TODO: read the config from cloud
+def load_config(path: str = None) -> dict:
+    if not path:
+        path = MODULE_DIR / 'config.yml'
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
+
+# TODO: read the prompts from cloud
+def load_system_prompt(path: str = None) -> str:
+    if not path:
+        path = MODULE_DIR / 'system_prompt.md'
+    with open(path, "r") as f:
+        return f.read()
+
+def load_user_prompt(path: str = None) -> str:
+    if not path:
+        path = MODULE_DIR / 'user_prompt.txt'
+    with open(path, "r") as f:
+        return f.read()
+
+def hash_resume(resume: str) -> str:
+    """
+    Returns the hash of the resume and of the prompt version of the profiler, used to version the resume profile,
+    so that the profile is distilled again when the resume or the profiler changes.
+    """
+    return hashlib.sha256(f"{resume_profiler.prompt_version()}|{resume}".encode('utf-8')).hexdigest()
+
+def format_resume_profile(profile: ResumeProfile) -> str:
+    """
+    Formats the resume profile as the compact text that is sent to the other agents.
+    """
+    lines = [f"Seniority: {profile.seniority}"]
+    if profile.years_of_experience is not None:
+        lines.append(f"Years of experience: {profile.years_of_experience}")
+    for label, values in [
+        ('Roles', profile.roles),
+        ('Skills', profile.skills),
+        ('Domains', profile.domains),
+        ('Languages', profile.languages),
+        ('Hard constraints', profile.hard_constraints),
+    ]:
+        if values:
+            lines.append(f"{label}: {', '.join(values)}")
+
+    return '\n'.join(lines)
+
+def instantiate_resume_profiler(
+    agent_config: dict = None,
+    llm_config: dict = None,
+    system_prompt: str = None,
+    user_prompt: str = None,
+):
+    """
+    Builds the agent chain, use `resume_profiler.chain()` to reuse the chain built by the registry instead.
+    :param agent_config: the agent config, loaded from config.yml if not given
+    :param llm_config: the llm config, defaults to the llm of the agent config
+    :param system_prompt: the system prompt, loaded from system_prompt.md if not given
+    :param user_prompt: the user prompt, loaded from user_prompt.txt if not given
+    :return:
+    """
+    if agent_config is None:
+        agent_config = load_config()
+    if llm_config is None:
+        llm_config = agent_config.get('llm')
+    llm = llm_factory(model_name=llm_config['model_name'], kwargs=dict(llm_config.get('kwargs') or {}))
+
+    if not agent_config.get('streaming'):
+        llm.disable_streaming = True
+
+    if system_prompt is None:
+        system_prompt = load_system_prompt()
+    if user_prompt is None:
+        user_prompt = load_user_prompt()
+    prompt_template = ChatPromptTemplate.from_messages([
+        ('system', system_prompt),
+        ('human', user_prompt)
+    ])
+
+    if agent_config.get("output") == "Structured":
+        structured_llm = llm.with_structured_output(ResumeProfile)
+        return prompt_template | structured_llm
+
+    return prompt_template | llm
+
+resume_profiler = agent_registry.register(name='resume_profiler', directory=MODULE_DIR, build=instantiate_resume_profiler)
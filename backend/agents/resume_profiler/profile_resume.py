@@ -0,0 +1,42 @@
+import asyncio
+from typing import Optional
+
+from backend.agents.resume_profiler.agent import resume_profiler, ResumeProfile, format_resume_profile
+from backend.agents.call_tracker import LLMCallTracker
+from backend.config import logger
+
+
+async def profile_resume(
+          resume: str,
+          call_tracker: Optional[LLMCallTracker] = None,
+) -> Optional[ResumeProfile]:
+    """
+    Distills the resume into a compact structured profile.
+    :param resume: the resume text
+    :param call_tracker: optional tracker of the LLM calls
+    :return: the resume profile, None if the profiler did not return a valid profile
+    """
+    profiler = resume_profiler.chain()
+    output = await profiler.ainvoke(
+        {'resume': resume},
+        config={'callbacks': [call_tracker] if call_tracker else []},
+    )
+
+    if not isinstance(output, ResumeProfile):
+        logger.warning("The resume profiler output is not an instance of ResumeProfile")
+        return None
+
+    return output
+
+async def main():
+    # mock resume
+    with open('../../resume.md') as f:
+        resume = f.read()
+
+    profile = await profile_resume(resume)
+    if profile:
+        logger.info(f"Resume profile:\n{format_resume_profile(profile)}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
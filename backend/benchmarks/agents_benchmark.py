@@ -0,0 +1,164 @@
+"""
+Offline benchmark of the agent stages, the agents run on the FakeChatModel so no network is needed.
+
+Usage:
+    python -m backend.benchmarks.agents_benchmark --n-jobs 500 --latency 0.5 --failure-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+import numpy as np
+
+from backend.agents.fake_llm import fake_call_recorder
+from backend.agents.job_filterer import agent as job_filterer_agent
+from backend.agents.job_short_lister import agent as job_short_lister_agent
+from backend.database.models import Job, JobDescription, UserProfile
+
+MODULE_DIR = Path(__file__).resolve().parent
+
+# the agents of the benchmarked stages, their configs are overridden to run on the fake model
+BENCHMARKED_AGENTS = (job_filterer_agent.job_filterer, job_short_lister_agent.job_short_lister)
+
+
+def load_corpus(n_jobs: int) -> List[Job]:
+    """
+    Builds a corpus of `n_jobs` jobs by cycling over the fixture jobs.
+    Every job gets a unique id which is part of the prompt, so the fake outputs differ between copies.
+    """
+    with open(MODULE_DIR / 'fixtures' / 'jobs.json') as f:
+        fixture_jobs = json.load(f)
+
+    jobs = []
+    for i in range(n_jobs):
+        fixture_job = fixture_jobs[i % len(fixture_jobs)]
+        jobs.append(Job(
+            id=i + 1,
+            linkedin_job_id=str(4_000_000_000 + i),
+            title=fixture_job['title'],
+            company=fixture_job['company'],
+            location=fixture_job['location'],
+            url=f"https://www.linkedin.com/jobs/view/{4_000_000_000 + i}",
+            description_record=JobDescription.from_text(f"{fixture_job['description']}\n\nReference: {i}"),
+        ))
+    return jobs
+
+
+def load_user() -> UserProfile:
+    with open(MODULE_DIR / 'fixtures' / 'resume.md') as f:
+        resume = f.read()
+    return UserProfile(
+        id=1,
+        name="benchmark_user",
+        email="benchmark@scoutling.com",
+        job_titles=["Machine Learning Engineer"],
+        job_countries=["Denmark"],
+        resume_text=resume,
+        filter_instructions="Looking for machine learning engineer, AI Engineer and data science roles. No student or internship roles.",
+    )
+
+
+def concurrency_stats(calls: List[tuple[float, float, bool]], wall_time: float) -> dict:
+    """
+    Computes the peak and average number of in-flight calls.
+    """
+    if not calls:
+        return {'peak_concurrency': 0, 'avg_concurrency': 0.0, 'concurrency_utilisation': 0.0}
+
+    events = sorted([(start, 1) for start, _, _ in calls] + [(end, -1) for _, end, _ in calls])
+    in_flight = peak = 0
+    for _, delta in events:
+        in_flight += delta
+        peak = max(peak, in_flight)
+
+    busy_time = sum(end - start for start, end, _ in calls)
+    avg = busy_time / wall_time if wall_time else 0.0
+    return {
+        'peak_concurrency': peak,
+        'avg_concurrency': avg,
+        'concurrency_utilisation': avg / peak,
+    }
+
+
+async def run_stage(name: str, n_jobs: int, stage: Callable[[], Awaitable]) -> dict:
+    fake_call_recorder.reset()
+    start = time.perf_counter()
+    await stage()
+    wall_time = time.perf_counter() - start
+
+    calls = list(fake_call_recorder.calls)
+    latencies = np.array([end - start for start, end, _ in calls]) if calls else np.zeros(1)
+    return {
+        'stage': name,
+        'jobs': n_jobs,
+        'calls': len(calls),
+        'failed_calls': sum(1 for _, _, succeeded in calls if not succeeded),
+        'wall_time': wall_time,
+        'jobs_per_sec': n_jobs / wall_time if wall_time else 0.0,
+        'p50_latency': float(np.percentile(latencies, 50)),
+        'p95_latency': float(np.percentile(latencies, 95)),
+        **concurrency_stats(calls, wall_time),
+    }
+
+
+def print_report(results: List[dict]):
+    header = f"{'stage':<26}{'jobs':>7}{'calls':>7}{'failed':>8}{'wall s':>9}{'jobs/s':>9}{'p50 s':>8}{'p95 s':>8}{'peak':>6}{'util':>7}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(
+            f"{r['stage']:<26}{r['jobs']:>7}{r['calls']:>7}{r['failed_calls']:>8}{r['wall_time']:>9.2f}"
+            f"{r['jobs_per_sec']:>9.1f}{r['p50_latency']:>8.3f}{r['p95_latency']:>8.3f}"
+            f"{r['peak_concurrency']:>6}{r['concurrency_utilisation']:>7.1%}"
+        )
+
+
+async def main(args: argparse.Namespace):
+    from backend.agents.job_short_lister.shortlist_jobs import shortlist_jobs
+    from backend.agents.job_filterer.filter_jobs import filter_jobs
+    from backend.queue.worker import async_analysis_pipeline
+
+    fake_llm = {
+        'model_name': 'fake',
+        'kwargs': {
+            'latency': args.latency,
+            'failure_rate': args.failure_rate,
+            'seed': args.seed,
+        },
+    }
+    jobs = load_corpus(args.n_jobs)
+    user = load_user()
+
+    with ExitStack() as stack:
+        for agent in BENCHMARKED_AGENTS:
+            stack.enter_context(agent.override_config(llm=fake_llm, fallback_llm=None))
+
+        results = [
+            await run_stage('shortlist_jobs', len(jobs), lambda: shortlist_jobs(
+                jobs=jobs,
+                user_instructions=user.filter_instructions,
+            )),
+            await run_stage('filter_jobs', len(jobs), lambda: filter_jobs(
+                jobs=jobs,
+                user_instructions=user.filter_instructions,
+                resume=user.resume_text,
+            )),
+            await run_stage('async_analysis_pipeline', len(jobs), lambda: async_analysis_pipeline(
+                user, jobs, user.resume_text
+            )),
+        ]
+
+    print_report(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline benchmark of the agent stages")
+    parser.add_argument('--n-jobs', type=int, default=200, help="Number of jobs in the corpus")
+    parser.add_argument('--latency', type=float, default=0.5, help="Mean latency of a fake LLM call in seconds")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Probability of a fake LLM call failing")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the fake LLM")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""
+Import-time profile of the entrypoints of the backend, every import runs in a fresh interpreter so the imports are cold.
+
+Reports the median import time of every entrypoint and its slowest imports, and fails if an entrypoint
+imports a module it should only import lazily, e.g. the API importing the LLM stack.
+
+Usage:
+    python -m backend.benchmarks.import_time_benchmark --repeats 5 --top 10
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+# the heavy dependencies only the code that runs the agents should import
+LLM_STACK = ('langchain', 'langchain_core', 'langchain_openai', 'openai', 'tiktoken', 'scipy')
+
+# entrypoint -> the top-level packages it must not import
+ENTRYPOINTS = {
+    'backend.APIs.job_apis': LLM_STACK,
+    'backend.queue.worker': LLM_STACK,
+    'backend.database.migrations': LLM_STACK + ('celery', 'fastapi'),
+}
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def profile_import(module: str) -> List[tuple[str, int, int, int]]:
+    """
+    Imports the module in a fresh interpreter with -X importtime.
+    :return: the (module, self us, cumulative us, depth) of every imported module
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{result.stderr}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return imports
+
+
+def profile_entrypoint(module: str, repeats: int) -> Dict:
+    runs = [profile_import(module) for _ in range(repeats)]
+    totals = [next(cumulative for name, _, cumulative, _ in run if name == module) for run in runs]
+    last_run = runs[-1]
+    # the direct imports of the entrypoint, the modules it is worth deferring
+    direct_imports = sorted(
+        ((name, cumulative) for name, _, cumulative, depth in last_run if depth == 1),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    return {
+        'module': module,
+        'median_seconds': statistics.median(totals) / 1e6,
+        'direct_imports': direct_imports,
+        'imported_packages': {name.split('.')[0] for name, _, _, _ in last_run},
+    }
+
+
+def main(args: argparse.Namespace) -> int:
+    failed = False
+    for module, forbidden in ENTRYPOINTS.items():
+        profile = profile_entrypoint(module, args.repeats)
+        print(f"{module}: {profile['median_seconds']:.3f}s (median of {args.repeats})")
+        for name, cumulative in profile['direct_imports'][:args.top]:
+            print(f"    {cumulative / 1e6:>8.3f}s  {name}")
+
+        eager_imports = sorted(set(forbidden) & profile['imported_packages'])
+        if eager_imports:
+            failed = True
+            print(f"    FAIL: imports {', '.join(eager_imports)}, which must be imported lazily")
+        print()
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import-time profile of the entrypoints of the backend")
+    parser.add_argument('--repeats', type=int, default=3, help="Number of cold imports per entrypoint")
+    parser.add_argument('--top', type=int, default=8, help="Number of the slowest direct imports to show")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,125 @@
+"""
+Offline benchmark of the serialisation of the list endpoints, no database is needed.
+
+Compares the CPU time per request of building a page of rows:
+- pydantic: a response model per row, then the validation and serialisation of FastAPI against the response_model
+- orjson: the fast path of the list endpoints, the rows serialised as they are by FastJSONResponse
+
+Usage:
+    python -m backend.benchmarks.serialization_benchmark --items 50 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+import orjson
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import Row, column
+from sqlalchemy.engine.result import result_tuple
+
+from backend.APIs.responses import FastJSONResponse, rows_as_items
+from backend.APIs.schemas import FilteredJobSummary, FilteredJobsPage
+
+MODULE_DIR = Path(__file__).resolve().parent
+
+# the columns selected by get_filtered_jobs, with the keyset column of the page last
+COLUMNS = [column(name) for name in FilteredJobSummary.model_fields]
+ROW_KEYS = [*FilteredJobSummary.model_fields, 'analysis_id']
+# created once per route by FastAPI
+RESPONSE_FIELD = create_model_field(name="Response_get_filtered_jobs", type_=FilteredJobsPage, mode="serialization")
+
+
+def load_rows(n_items: int) -> List[Row]:
+    """
+    Builds the rows of a page by cycling over the fixture jobs, as returned by the select of get_filtered_jobs.
+    """
+    with open(MODULE_DIR / 'fixtures' / 'jobs.json') as f:
+        fixture_jobs = json.load(f)
+
+    make_row = result_tuple(ROW_KEYS)
+    analyzed_at = datetime(2025, 1, 1, 12, 0, 0, 123456)
+    rows = []
+    for i in range(n_items):
+        fixture_job = fixture_jobs[i % len(fixture_jobs)]
+        rows.append(make_row((
+            i + 1,
+            str(4_000_000_000 + i),
+            fixture_job['title'],
+            f"https://www.linkedin.com/jobs/view/{4_000_000_000 + i}",
+            fixture_job['company'],
+            fixture_job['location'],
+            i % 3 == 0,
+            "The role matches the machine learning experience of the resume, but requires fluent Danish.",
+            i % 7 == 0,
+            analyzed_at - timedelta(minutes=i),
+            i + 1,
+        )))
+    return rows
+
+
+async def pydantic_response(rows: List[Row]) -> bytes:
+    items = [
+        FilteredJobSummary(
+            id=row.id,
+            linkedin_job_id=row.linkedin_job_id,
+            title=row.title,
+            company=row.company,
+            location=row.location,
+            url=row.url,
+            relevant=row.relevant,
+            relevancy_reason=row.relevancy_reason,
+            applied=row.applied,
+            analyzed_at=row.analyzed_at,
+        )
+        for row in rows
+    ]
+    page = FilteredJobsPage(items=items, next_cursor=None)
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=page)
+    return JSONResponse(content).body
+
+
+async def orjson_response(rows: List[Row]) -> bytes:
+    return FastJSONResponse({'items': rows_as_items(rows, COLUMNS), 'next_cursor': None}).body
+
+
+async def measure(build: Callable[[List[Row]], Awaitable[bytes]], rows: List[Row], n_requests: int) -> float:
+    """
+    :return: the CPU time per request in microseconds
+    """
+    for _ in range(min(n_requests, 100)):
+        await build(rows)
+    start = time.process_time()
+    for _ in range(n_requests):
+        await build(rows)
+    return (time.process_time() - start) / n_requests * 1e6
+
+
+async def main(args: argparse.Namespace):
+    rows = load_rows(args.items)
+
+    # both paths must produce the same document
+    expected = orjson.loads(await pydantic_response(rows))
+    assert orjson.loads(await orjson_response(rows)) == expected, "the fast path differs from the response_model"
+
+    pydantic_us = await measure(pydantic_response, rows, args.requests)
+    orjson_us = await measure(orjson_response, rows, args.requests)
+
+    header = f"{'path':<10}{'items':>7}{'cpu us/request':>16}{'bytes':>8}"
+    print(header)
+    print('-' * len(header))
+    print(f"{'pydantic':<10}{args.items:>7}{pydantic_us:>16.1f}{len(await pydantic_response(rows)):>8}")
+    print(f"{'orjson':<10}{args.items:>7}{orjson_us:>16.1f}{len(await orjson_response(rows)):>8}")
+    print(f"\nspeedup: {pydantic_us / orjson_us:.1f}x, {1 - orjson_us / pydantic_us:.0%} less CPU per request")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline benchmark of the serialisation of the list endpoints")
+    parser.add_argument('--items', type=int, default=50, help="Number of items per page")
+    parser.add_argument('--requests', type=int, default=2000, help="Number of requests to measure per path")
+    asyncio.run(main(parser.parse_args()))
@@ -1,17 +1,29 @@
 import os
+from functools import lru_cache
 from pathlib import Path
 import logging
 
-from dotenv import dotenv_values
-
 dev_env_path = env_path = (Path(__file__).resolve().parent / ".." / ".env.development").resolve()
-config = dotenv_values(dotenv_path=dev_env_path)
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-try:
-    os.environ['OPENAI_API_KEY'] = config['OPENAI_API_KEY']
-except KeyError:
-    raise KeyError('OPENAI_API_KEY not set!')
 
+@lru_cache(maxsize=None)
+def load_config() -> dict:
+    """
+    Reads .env.development on first use rather than on import, the API and the scripts that never call an LLM don't need it.
+    """
+    from dotenv import dotenv_values
+
+    return dotenv_values(dotenv_path=dev_env_path)
+
+
+def set_openai_api_key():
+    """
+    Exports the OpenAI API key of .env.development, must be called before an OpenAI model is instantiated.
+    """
+    try:
+        os.environ['OPENAI_API_KEY'] = load_config()['OPENAI_API_KEY']
+    except KeyError:
+        raise KeyError('OPENAI_API_KEY not set!')
@@ -0,0 +1,158 @@
+from typing import List, AsyncIterator
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend.database.models import Job as JobTable, UserProfile, JobAnalysis
+from backend.database.utils import supported_countries
+from backend.database.engine import create_async_db_engine
+from backend.database.user_cache import user_cache
+from backend.config import logger
+
+async_engine = create_async_db_engine()
+
+# objects are not expired on commit, since lazily refreshing them is not possible in async code
+async_session_factory = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+async def get_async_db_session() -> AsyncIterator[AsyncSession]:
+    """Async dependency db session"""
+    async with async_session_factory() as session:
+        yield session
+
+async def aget_user(
+    email: str,
+    session: AsyncSession,
+) -> UserProfile:
+
+    user = (await session.exec(select(UserProfile).where(UserProfile.email == email))).first()
+    user: UserProfile
+
+    return user
+
+async def aget_cached_user(
+    email: str,
+    session: AsyncSession,
+) -> UserProfile:
+    """
+    Returns the user profile from the process-local cache, loading it on a miss.
+    The returned profile is read-only, use aget_user to load a profile that is modified.
+    """
+    user = user_cache.get(email)
+    if user is not None:
+        return user
+
+    version = user_cache.version(email)
+    user = await aget_user(email=email, session=session)
+    if user:
+        user_cache.set(user, version)
+
+    return user
+
+async def ainsert_resume(
+    user: UserProfile,
+    resume: str,
+    session: AsyncSession,
+):
+    """
+    Inserts a resume into the user profile.
+    :param user: user profile
+    :param resume: the resume text
+    :param session: the async db session
+    :return:
+    """
+    logger.info(f"Inserting resume into user profile: {user.email}")
+    user.resume_text = resume
+    session.add(user)
+    await session.commit()
+    logger.info(f"Resume inserted into user profile: {user.email}")
+
+async def ainsert_user_instructions(
+    user: UserProfile,
+    user_instructions: str,
+    session: AsyncSession,
+):
+    """
+    Inserts user instructions into the user profile.
+    :param user: user profile
+    :param user_instructions: the user instructions text
+    :param session: the async db session
+    :return:
+    """
+    logger.info(f"Inserting user instructions into user profile: {user.email}")
+    user.filter_instructions = user_instructions
+    session.add(user)
+    await session.commit()
+    logger.info(f"User instructions inserted into user profile: {user.email}")
+
+async def ainsert_user_job_search_countries(
+    user: UserProfile,
+    job_search_countries: List[str],
+    session: AsyncSession,
+):
+    """
+    Updates user job search countries in the user profile.
+    Replaces the existing list with the new provided list.
+    :param user: user profile
+    :param job_search_countries: countries for the job search
+    :param session: the async db session
+    :return:
+    """
+    logger.info(f"Updating job search countries for user: {user.email}")
+
+    # Overwrite with the new valid list
+    user.job_countries = supported_countries(job_search_countries)
+
+    session.add(user)
+    await session.commit()
+    logger.info(f"Job search countries updated for user: {user.email}")
+
+async def ainsert_user_job_search_titles(
+    user: UserProfile,
+    job_search_titles: List[str],
+    session: AsyncSession,
+):
+    """
+    Updates user job search titles in the user profile.
+    Replaces the existing list with the new provided list.
+    :param user: user profile
+    :param job_search_titles: titles for the job search
+    :param session: the async db session
+    :return:
+    """
+    logger.info(f"Updating job search titles for user: {user.email}")
+
+    # Overwrite with the new list
+    user.job_titles = job_search_titles
+
+    session.add(user)
+    await session.commit()
+    logger.info(f"Job search titles updated for user: {user.email}")
+
+async def aupdate_job_applied_status(
+    user: UserProfile,
+    linkedin_job_id: str,
+    applied: bool,
+    session: AsyncSession,
+):
+    """
+    Updates the applied status for a specific job and user.
+    """
+    logger.info(f"Updating applied status for job {linkedin_job_id} to {applied} for user {user.email}")
+
+    # Find the analysis record of the job in a single query
+    statement = (
+        select(JobAnalysis)
+        .join(JobTable, JobAnalysis.job_id == JobTable.id)
+        .where(JobTable.linkedin_job_id == linkedin_job_id)
+        .where(JobAnalysis.user_id == user.id)
+    )
+    analysis = (await session.exec(statement)).first()
+
+    if analysis:
+        analysis.applied = applied
+        session.add(analysis)
+        await session.commit()
+        logger.info("Applied status updated.")
+    else:
+        logger.warning(f"JobAnalysis record not found for job {linkedin_job_id} and this user.")
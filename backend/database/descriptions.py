@@ -0,0 +1,23 @@
+import hashlib
+import zlib
+from functools import lru_cache
+
+DESCRIPTION_COMPRESSION_LEVEL = 9
+# number of decompressed descriptions kept in memory, the agent stages read every description several times
+DECOMPRESSED_CACHE_SIZE = 2048
+
+
+def hash_description(description: str) -> str:
+    """
+    Returns the content address of a description, the sha256 of its utf-8 encoding.
+    """
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+def compress_description(description: str) -> bytes:
+    return zlib.compress(description.encode('utf-8'), DESCRIPTION_COMPRESSION_LEVEL)
+
+
+@lru_cache(maxsize=DECOMPRESSED_CACHE_SIZE)
+def decompress_description(content: bytes) -> str:
+    return zlib.decompress(content).decode('utf-8')
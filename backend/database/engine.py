@@ -0,0 +1,71 @@
+from typing import Optional
+
+from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import Session, create_engine
+
+from backend.constants import (
+    DATABASE_ENDPOINT,
+    ASYNC_DATABASE_ENDPOINT,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+)
+
+
+def pool_settings(
+    pool_size: Optional[int] = None,
+    max_overflow: Optional[int] = None,
+    pool_timeout: Optional[int] = None,
+    pool_recycle: Optional[int] = None,
+    pool_pre_ping: Optional[bool] = None,
+) -> dict:
+    """
+    Returns the connection pool settings of the engines, the arguments that are not given default to the constants.
+    """
+    return dict(
+        pool_size=DB_POOL_SIZE if pool_size is None else pool_size,
+        max_overflow=DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT if pool_timeout is None else pool_timeout,
+        pool_recycle=DB_POOL_RECYCLE if pool_recycle is None else pool_recycle,
+        pool_pre_ping=DB_POOL_PRE_PING if pool_pre_ping is None else pool_pre_ping,
+    )
+
+
+def create_db_engine(endpoint: str = DATABASE_ENDPOINT, **pool_kwargs) -> Engine:
+    """
+    Creates a sync engine with the tuned connection pool.
+    :param endpoint: the database url
+    :param pool_kwargs: overrides of the pool settings, see pool_settings
+    :return: the engine
+    """
+    return create_engine(endpoint, echo=False, **pool_settings(**pool_kwargs))
+
+
+def create_async_db_engine(endpoint: str = ASYNC_DATABASE_ENDPOINT, **pool_kwargs) -> AsyncEngine:
+    """
+    Creates an async engine with the tuned connection pool.
+    :param endpoint: the async database url
+    :param pool_kwargs: overrides of the pool settings, see pool_settings
+    :return: the async engine
+    """
+    return create_async_engine(endpoint, echo=False, **pool_settings(**pool_kwargs))
+
+
+# the process wide sync engine, used by the API, the worker and the init code
+engine = create_db_engine()
+
+
+def get_session() -> Session:
+    """Dependency db session"""
+    return Session(engine)
+
+
+def dispose_engine_after_fork():
+    """
+    Drops the pooled connections inherited from the parent process without closing them,
+    the parent still owns them, so that the forked process opens its own connections.
+    """
+    engine.dispose(close=False)
@@ -1,10 +1,9 @@
-from sqlmodel import SQLModel, create_engine, Session, select, text, delete
+from sqlmodel import SQLModel, Session, select, text, delete
 
-from backend.database.models import Job, JobAnalysis, UserProfile
+from backend.database.models import Job, JobAnalysis, UserProfile, AnalysisRun, JobArchive
+from backend.database.migrations import run_migrations
+from backend.database.engine import engine, get_session
 from backend.config import logger
-from backend.constants import DATABASE_ENDPOINT
-
-engine = create_engine(DATABASE_ENDPOINT, echo=False)
 
 users = [
     UserProfile(
@@ -16,18 +15,14 @@ users = [
     )
 ]
 
-def get_session():
-    """Dependency db session"""
-    return Session(engine)
-
 def init_db(override: bool = False):
     """Creates the tables if they don't exist and populates default users."""
     if override:
         logger.info("Removing all the data and overriding the default")
         clear_all_data(reset_ids=False)
 
-    # create tables
-    SQLModel.metadata.create_all(engine)
+    # create tables and upgrade the existing ones
+    run_migrations(engine)
 
     with Session(engine) as session:
 
@@ -60,7 +55,7 @@ def clear_all_data(reset_ids: bool = True):
             # Method 1: TRUNCATE (Fast, Resets IDs, requires raw SQL)
             # 'CASCADE' ensures linked data (like JobAnalysis) is also cleared
             logger.info("Truncating tables (resetting IDs)...")
-            session.exec(text("TRUNCATE TABLE userprofile, job, jobanalysis RESTART IDENTITY CASCADE"))
+            session.exec(text("TRUNCATE TABLE userprofile, job, jobdescription, jobanalysis, analysisrun, jobarchive, crawlquery, crawlqueryjob RESTART IDENTITY CASCADE"))
         else:
             SQLModel.metadata.drop_all(engine)
 
@@ -0,0 +1,295 @@
+from typing import Callable, Optional
+
+from sqlalchemy import Engine, Connection
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import SQLModel, text
+
+from backend.database.models import JobDescription
+from backend.config import logger
+
+# number of jobs per batch of the data migrations
+MIGRATION_BATCH_SIZE = 1000
+
+
+def index_is_valid(connection: Connection, name: str) -> Optional[bool]:
+    """
+    :return: whether the index is valid, None if it doesn't exist.
+        A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind, which IF NOT EXISTS would skip.
+    """
+    return connection.execute(
+        text("""
+            SELECT i.indisvalid
+            FROM pg_class c
+            JOIN pg_index i ON i.indexrelid = c.oid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relname = :name AND n.nspname = current_schema()
+        """),
+        {'name': name},
+    ).scalar()
+
+
+def concurrent_index(name: str, create_statement: str, prepare: Optional[str] = None) -> Callable[[Connection], None]:
+    """
+    Migration step building an index CONCURRENTLY, unless a valid one exists.
+    An invalid index, left by a failed build, is dropped and built again.
+    :param name: the name of the index
+    :param create_statement: the CREATE INDEX CONCURRENTLY statement of the index
+    :param prepare: optional statement to run before the index is built, e.g. removing the rows violating a unique index,
+        it only runs when the index is built
+    """
+    def step(connection: Connection):
+        is_valid = index_is_valid(connection, name)
+        if is_valid:
+            return
+        if is_valid is False:
+            logger.warning(f"Index {name} is invalid, a previous build failed, rebuilding it")
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        if prepare:
+            connection.execute(text(prepare))
+        connection.execute(text(create_statement))
+
+    return step
+
+
+def copy_job_descriptions_batch(connection: Connection) -> int:
+    """
+    Copies the inline descriptions of the next batch of jobs without a description_hash into jobdescription.
+    :return: the number of jobs in the batch, 0 once every job has a description_hash
+    """
+    rows = connection.execute(
+        text("SELECT id, description FROM job WHERE description_hash IS NULL ORDER BY id LIMIT :limit FOR UPDATE"),
+        {'limit': MIGRATION_BATCH_SIZE},
+    ).all()
+    if not rows:
+        return 0
+
+    records = {}
+    hashes = []
+    for _, description in rows:
+        record = JobDescription.from_text(description or "")
+        records[record.hash] = {'hash': record.hash, 'content': record.content, 'created_at': record.created_at}
+        hashes.append(record.hash)
+
+    connection.execute(
+        pg_insert(JobDescription).values(list(records.values())).on_conflict_do_nothing(index_elements=['hash'])
+    )
+    connection.execute(
+        text("UPDATE job SET description_hash = :hash WHERE id = :id"),
+        [{'hash': description_hash, 'id': job_id} for (job_id, _), description_hash in zip(rows, hashes)],
+    )
+    return len(rows)
+
+
+def move_job_descriptions(connection: Connection):
+    """
+    Moves the inline descriptions of the jobs into the content-addressed jobdescription table,
+    and computes the search vectors from them before the inline descriptions are dropped.
+    Every step is resumable: the batches are copied in their own transactions, so an interrupted migration
+    continues with the jobs that have no description_hash yet, and the column is only dropped
+    in a transaction that has verified that every job has one.
+    """
+    has_inline_descriptions = connection.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'job' AND column_name = 'description'
+    """)).first()
+    if not has_inline_descriptions:
+        return
+
+    # the search vector was generated from the inline description, it is computed on insert from now on
+    connection.execute(text("ALTER TABLE job ALTER COLUMN search_vector DROP EXPRESSION IF EXISTS"))
+    connection.execute(text("""
+        UPDATE job SET search_vector =
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(company, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'C')
+        WHERE search_vector IS NULL
+    """))
+
+    # the migration connection is in autocommit mode, the batches run on transactional connections
+    n_moved = 0
+    while True:
+        with connection.engine.begin() as batch_connection:
+            n_batch = copy_job_descriptions_batch(batch_connection)
+        if not n_batch:
+            break
+        n_moved += n_batch
+
+    with connection.engine.begin() as drop_connection:
+        # the jobs inserted meanwhile by an older version of the app are copied under the lock
+        drop_connection.execute(text("LOCK TABLE job IN SHARE ROW EXCLUSIVE MODE"))
+        n_batch = copy_job_descriptions_batch(drop_connection)
+        while n_batch:
+            n_moved += n_batch
+            n_batch = copy_job_descriptions_batch(drop_connection)
+        n_missing = drop_connection.execute(text("SELECT count(*) FROM job WHERE description_hash IS NULL")).scalar()
+        if n_missing:
+            raise RuntimeError(f"{n_missing} jobs have no description_hash, not dropping job.description")
+        drop_connection.execute(text("ALTER TABLE job DROP COLUMN description"))
+    logger.info(f"Moved the descriptions of {n_moved} jobs into jobdescription")
+
+
+# Idempotent schema upgrades for databases created by an older version of the models.
+# New tables are created by SQLModel.metadata.create_all in run_migrations,
+# these only cover columns and indexes of existing tables, and the data moved between them.
+# A step is either a SQL statement or a function of the connection.
+# Indexes are built CONCURRENTLY so that the tables stay writable while they are built, see concurrent_index.
+MIGRATIONS = [
+    (
+        "add resume profile to userprofile",
+        [
+            "ALTER TABLE userprofile ADD COLUMN IF NOT EXISTS resume_profile JSON",
+            "ALTER TABLE userprofile ADD COLUMN IF NOT EXISTS resume_profile_hash VARCHAR",
+        ],
+    ),
+    (
+        "add near-duplicate clusters to job",
+        [
+            "ALTER TABLE job ADD COLUMN IF NOT EXISTS simhash BIGINT",
+            "ALTER TABLE job ADD COLUMN IF NOT EXISTS cluster_id INTEGER REFERENCES job (id)",
+            concurrent_index("ix_job_cluster_id", "CREATE INDEX CONCURRENTLY ix_job_cluster_id ON job (cluster_id)"),
+        ],
+    ),
+    (
+        "add unique (user_id, job_id) to jobanalysis",
+        [
+            concurrent_index(
+                "uq_jobanalysis_user_job",
+                "CREATE UNIQUE INDEX CONCURRENTLY uq_jobanalysis_user_job ON jobanalysis (user_id, job_id)",
+                # keep a single analysis per user and job, preferring the applied one and then the latest one
+                prepare="""
+                DELETE FROM jobanalysis a USING jobanalysis b
+                WHERE a.user_id = b.user_id
+                  AND a.job_id = b.job_id
+                  AND (a.applied, a.id) < (b.applied, b.id)
+                """,
+            ),
+        ],
+    ),
+    (
+        "add keyset listing indexes to jobanalysis",
+        [
+            concurrent_index(
+                "ix_jobanalysis_user_relevant_listing",
+                """
+                CREATE INDEX CONCURRENTLY ix_jobanalysis_user_relevant_listing
+                ON jobanalysis (user_id, is_relevant, analyzed_at DESC, id DESC) INCLUDE (job_id)
+                """,
+            ),
+            concurrent_index(
+                "ix_jobanalysis_user_applied_listing",
+                """
+                CREATE INDEX CONCURRENTLY ix_jobanalysis_user_applied_listing
+                ON jobanalysis (user_id, is_relevant, applied, analyzed_at DESC, id DESC) INCLUDE (job_id)
+                """,
+            ),
+            # superseded by the indexes above, it lacked the id of the keyset order
+            "DROP INDEX CONCURRENTLY IF EXISTS ix_jobanalysis_user_listing",
+        ],
+    ),
+    (
+        "add full-text search vector to job",
+        [
+            "ALTER TABLE job ADD COLUMN IF NOT EXISTS search_vector TSVECTOR",
+            concurrent_index(
+                "ix_job_search_vector",
+                "CREATE INDEX CONCURRENTLY ix_job_search_vector ON job USING GIN (search_vector)",
+            ),
+        ],
+    ),
+    (
+        "add retention indexes to job and jobanalysis",
+        [
+            concurrent_index("ix_job_created_at", "CREATE INDEX CONCURRENTLY ix_job_created_at ON job (created_at)"),
+            # serves the lookups of the analyses of a job, across users
+            concurrent_index(
+                "ix_jobanalysis_job_id",
+                "CREATE INDEX CONCURRENTLY ix_jobanalysis_job_id ON jobanalysis (job_id)",
+            ),
+        ],
+    ),
+    (
+        "move job descriptions to jobdescription",
+        [
+            "ALTER TABLE job ADD COLUMN IF NOT EXISTS description_hash VARCHAR REFERENCES jobdescription (hash)",
+            move_job_descriptions,
+            concurrent_index(
+                "ix_job_description_hash",
+                "CREATE INDEX CONCURRENTLY ix_job_description_hash ON job (description_hash)",
+            ),
+        ],
+    ),
+    (
+        "add periodic refresh schedule to userprofile",
+        [
+            "ALTER TABLE userprofile ADD COLUMN IF NOT EXISTS next_refresh_at TIMESTAMP",
+            concurrent_index(
+                "ix_userprofile_next_refresh_at",
+                "CREATE INDEX CONCURRENTLY ix_userprofile_next_refresh_at ON userprofile (next_refresh_at)",
+            ),
+        ],
+    ),
+    (
+        "add simhash bands to job",
+        [
+            "ALTER TABLE job ADD COLUMN IF NOT EXISTS simhash_band_0 INTEGER",
+            "ALTER TABLE job ADD COLUMN IF NOT EXISTS simhash_band_1 INTEGER",
+            "ALTER TABLE job ADD COLUMN IF NOT EXISTS simhash_band_2 INTEGER",
+            "ALTER TABLE job ADD COLUMN IF NOT EXISTS simhash_band_3 INTEGER",
+            # the bands of the fingerprint, lowest bits first, see backend/dedup/simhash.py
+            """
+            UPDATE job SET
+                simhash_band_0 = (simhash >> 0) & 65535,
+                simhash_band_1 = (simhash >> 16) & 65535,
+                simhash_band_2 = (simhash >> 32) & 65535,
+                simhash_band_3 = (simhash >> 48) & 65535
+            WHERE simhash IS NOT NULL AND simhash_band_0 IS NULL
+            """,
+            concurrent_index(
+                "ix_job_simhash_band_0",
+                "CREATE INDEX CONCURRENTLY ix_job_simhash_band_0 ON job (simhash_band_0)",
+            ),
+            concurrent_index(
+                "ix_job_simhash_band_1",
+                "CREATE INDEX CONCURRENTLY ix_job_simhash_band_1 ON job (simhash_band_1)",
+            ),
+            concurrent_index(
+                "ix_job_simhash_band_2",
+                "CREATE INDEX CONCURRENTLY ix_job_simhash_band_2 ON job (simhash_band_2)",
+            ),
+            concurrent_index(
+                "ix_job_simhash_band_3",
+                "CREATE INDEX CONCURRENTLY ix_job_simhash_band_3 ON job (simhash_band_3)",
+            ),
+        ],
+    ),
+    (
+        "add inherited job count to analysisrun",
+        [
+            "ALTER TABLE analysisrun ADD COLUMN IF NOT EXISTS jobs_inherited INTEGER NOT NULL DEFAULT 0",
+        ],
+    ),
+]
+
+
+def run_migrations(engine: Engine):
+    """
+    Creates the missing tables and applies all the migrations, they are idempotent so already applied ones are no-ops.
+    The tables are created first, the migrations of the existing tables may reference the new ones.
+    Runs in autocommit mode since CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    """
+    SQLModel.metadata.create_all(engine)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for name, statements in MIGRATIONS:
+            logger.info(f"Applying migration: {name}")
+            for statement in statements:
+                if callable(statement):
+                    statement(connection)
+                else:
+                    connection.execute(text(statement))
+    logger.info("Database migrations complete.")
+
+
+if __name__ == '__main__':
+    from backend.database.engine import engine
+
+    run_migrations(engine)
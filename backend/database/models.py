@@ -2,7 +2,11 @@ from typing import Optional, List
 from enum import Enum
 from datetime import datetime
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import Text, Column, JSON
+from sqlalchemy import Text, Column, JSON, BigInteger, LargeBinary, Index, func, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
+
+from backend.database.descriptions import hash_description, compress_description, decompress_description
 
 class AnalysisStatus(str, Enum):
     IN_PROGRESS = "IN_PROGRESS"
@@ -10,8 +14,44 @@ class AnalysisStatus(str, Enum):
     FAILED = "FAILED"
 
 
+def job_search_vector(title, company, description):
+    """
+    SQL expression of the full-text search document of a job, the title weighs most and the description least.
+    """
+    def weighted(value, weight: str):
+        return func.setweight(func.to_tsvector('english', func.coalesce(value, '')), weight, type_=TSVECTOR)
+
+    return weighted(title, 'A').op('||')(weighted(company, 'B')).op('||')(weighted(description, 'C'))
+
+
+# --- The Job Descriptions (Content-Addressed, Compressed) ---
+class JobDescription(SQLModel, table=True):
+    # sha256 of the description, identical descriptions of reposted jobs are stored once
+    hash: str = Field(primary_key=True)
+    # zlib compressed utf-8 description
+    content: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    @classmethod
+    def from_text(cls, description: str) -> "JobDescription":
+        return cls(hash=hash_description(description), content=compress_description(description))
+
+    @property
+    def text(self) -> str:
+        return decompress_description(self.content)
+
+
+job_search_vector_column = Column("search_vector", TSVECTOR)
+
+
 # --- 1. The Job (Static Data) ---
 class Job(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_job_search_vector", "search_vector", postgresql_using="gin"),
+    )
+    # the search vector is only used in WHERE and ORDER BY clauses, never load it with the job
+    __mapper_args__ = {"properties": {"search_vector": deferred(job_search_vector_column)}}
+
     id: Optional[int] = Field(default=None, primary_key=True)
     # Using LinkedIn ID to prevent duplicates
     linkedin_job_id: str = Field(unique=True, index=True)
@@ -19,12 +59,32 @@ class Job(SQLModel, table=True):
     company: str
     location: str
     url: str
-    description: str = Field(default="")
+    # the description is stored in JobDescription, loaded lazily or in bulk with load_job_descriptions
+    description_hash: Optional[str] = Field(default=None, foreign_key="jobdescription.hash", index=True)
     posted_at: Optional[datetime] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+    # Near-duplicate detection: SimHash fingerprint of the posting
+    # and the id of the oldest posting of its near-duplicate cluster
+    simhash: Optional[int] = Field(default=None, sa_column=Column(BigInteger))
+    # the 4 16-bit bands of the fingerprint, see backend/dedup/simhash.py,
+    # the near-duplicates of a posting share at least one band, so they are looked up with the band indexes
+    simhash_band_0: Optional[int] = Field(default=None, index=True)
+    simhash_band_1: Optional[int] = Field(default=None, index=True)
+    simhash_band_2: Optional[int] = Field(default=None, index=True)
+    simhash_band_3: Optional[int] = Field(default=None, index=True)
+    cluster_id: Optional[int] = Field(default=None, foreign_key="job.id", index=True)
+
+    # Full-text search document, see job_search_vector
+    search_vector: Optional[str] = Field(default=None, sa_column=job_search_vector_column)
 
     # Relationship to analysis
     analysis: Optional["JobAnalysis"] = Relationship(back_populates="job")
+    description_record: Optional[JobDescription] = Relationship()
+
+    @property
+    def description(self) -> str:
+        return self.description_record.text if self.description_record else ""
 
 
 # --- 2. The User Context ---
@@ -35,21 +95,43 @@ class UserProfile(SQLModel, table=True):
     job_titles: List[str] = Field(default=[], sa_column=Column(JSON))
     job_countries: List[str] = Field(default=[], sa_column=Column(JSON))
     resume_text: str = Field(default="", sa_column=Column(Text))
+    # compact profile distilled from the resume, versioned by the hash of the resume it was distilled from
+    resume_profile: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    resume_profile_hash: Optional[str] = Field(default=None)
     filter_instructions: str = Field(default="", sa_column=Column(Text))
     last_job_search: Optional[datetime] = Field(default=None)
     analysis_task_id: Optional[str] = Field(default=None)
     analysis_status: AnalysisStatus = Field(default=AnalysisStatus.COMPLETED)
     analysis_started_at: Optional[datetime] = None
+    # next periodic refresh of the searches of the user, staggered between the users, see backend/queue/scheduler.py
+    next_refresh_at: Optional[datetime] = Field(default=None, index=True)
 
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 # --- 3. The AI Result ---
 class JobAnalysis(SQLModel, table=True):
+    __table_args__ = (
+        # one analysis per user and job, also serves the lookups by (user, job)
+        Index("uq_jobanalysis_user_job", "user_id", "job_id", unique=True),
+        # serve the keyset pagination of the suggestions listing, ordered by (analyzed_at, id) descending,
+        # filtered on relevancy, and on relevancy and applied status
+        Index(
+            "ix_jobanalysis_user_relevant_listing",
+            "user_id", "is_relevant", text("analyzed_at DESC"), text("id DESC"),
+            postgresql_include=["job_id"],
+        ),
+        Index(
+            "ix_jobanalysis_user_applied_listing",
+            "user_id", "is_relevant", "applied", text("analyzed_at DESC"), text("id DESC"),
+            postgresql_include=["job_id"],
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
     # Foreign Keys
-    job_id: int = Field(foreign_key="job.id")
+    job_id: int = Field(foreign_key="job.id", index=True)
     user_id: int = Field(foreign_key="userprofile.id")
 
     # AI Output
@@ -61,3 +143,83 @@ class JobAnalysis(SQLModel, table=True):
 
     # Relationship back to job
     job: Optional[Job] = Relationship(back_populates="analysis")
+
+
+# --- 4. The Analysis Run Accounting ---
+class AnalysisRun(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="userprofile.id", index=True)
+    task_id: Optional[str] = Field(default=None)
+    status: AnalysisStatus = Field(default=AnalysisStatus.IN_PROGRESS)
+
+    # Jobs
+    jobs_crawled: int = Field(default=0)
+    jobs_analyzed: int = Field(default=0)
+    jobs_relevant: int = Field(default=0)
+    # jobs whose analysis was copied from an analyzed near-duplicate
+    jobs_inherited: int = Field(default=0)
+
+    # LLM usage, summed over all the stages
+    llm_calls: int = Field(default=0)
+    failed_llm_calls: int = Field(default=0)
+    input_tokens: int = Field(default=0)
+    cached_input_tokens: int = Field(default=0)
+    output_tokens: int = Field(default=0)
+    llm_latency: float = Field(default=0.0)
+    cost_usd: float = Field(default=0.0)
+    # LLM usage per stage, keyed by the stage name
+    stages: dict = Field(default={}, sa_column=Column(JSON))
+
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+
+# --- 5. The Archived Jobs ---
+class JobArchive(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # id of the job before it was archived
+    job_id: int
+    linkedin_job_id: str = Field(unique=True, index=True)
+    title: str
+    company: str
+    location: str
+    url: str
+    # zlib compressed utf-8 description
+    description: bytes = Field(default=b"", sa_column=Column(LargeBinary))
+    posted_at: Optional[datetime] = None
+    created_at: datetime
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+    # name of the retention policy that archived the job
+    retention_policy: str
+
+
+# --- 6. The Crawled Searches ---
+class CrawlQuery(SQLModel, table=True):
+    """
+    A distinct (title, country) search of the users, crawled once per freshness window for all the users searching it.
+    """
+    __table_args__ = (
+        Index("uq_crawlquery_title_country", "title", "country", unique=True),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # normalized job title, see backend/queue/crawl_plan.py
+    title: str
+    country: str
+    last_crawled_at: Optional[datetime] = None
+    # set while a worker crawls the query, other workers skip the query until the crawl finished or its lease expired
+    crawl_started_at: Optional[datetime] = None
+    jobs_found: int = Field(default=0)
+
+
+class CrawlQueryJob(SQLModel, table=True):
+    """
+    A job found by a crawl of a query, every user searching the query only analyzes the jobs of its queries.
+    """
+    __table_args__ = (
+        # one link per query and job, also serves the lookups of the jobs of the queries of a user
+        Index("uq_crawlqueryjob_query_job", "crawl_query_id", "job_id", unique=True),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    crawl_query_id: int = Field(foreign_key="crawlquery.id")
+    # serves the removal of the links of the jobs removed by the retention policies
+    job_id: int = Field(foreign_key="job.id", index=True)
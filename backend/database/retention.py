@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Literal
+
+from pydantic import BaseModel
+from sqlmodel import Session, select, delete, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from backend.database.models import Job, JobAnalysis, JobArchive, JobDescription, CrawlQueryJob
+from backend.database.descriptions import compress_description
+from backend.database.utils import load_job_descriptions
+from backend.config import logger
+from backend.constants import JOB_RETENTION_POLICIES, JOB_RETENTION_BATCH_SIZE, JOB_RETENTION_MAX_BATCHES
+
+
+class RetentionPolicy(BaseModel):
+    name: str
+    max_age_days: int
+    state: Literal['unanalyzed', 'not_relevant']
+    action: Literal['archive', 'delete']
+
+
+def load_retention_policies() -> List[RetentionPolicy]:
+    return [RetentionPolicy(**policy) for policy in JOB_RETENTION_POLICIES]
+
+
+def stale_jobs_statement(policy: RetentionPolicy, batch_size: int):
+    """
+    Builds the statement selecting the next batch of jobs the policy applies to.
+    The rows are locked, skipping the ones locked by a concurrent retention run
+    and the ones an analysis is storing its results for, see insert_analyses.
+    An analysis still running on a removed job skips its result.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=policy.max_age_days)
+    # the analyses store the rejected jobs as well, a job rejected by every user analyzing it is not_relevant
+    any_analysis = select(JobAnalysis.id).where(JobAnalysis.job_id == Job.id)
+    # a job relevant to or applied to by any user is never removed
+    matched_analysis = any_analysis.where(JobAnalysis.is_relevant | JobAnalysis.applied)
+
+    statement = select(Job).where(Job.created_at < cutoff)
+    if policy.state == 'unanalyzed':
+        statement = statement.where(~any_analysis.exists())
+    else:
+        statement = statement.where(any_analysis.exists(), ~matched_analysis.exists())
+
+    return statement.order_by(Job.created_at).limit(batch_size).with_for_update(skip_locked=True)
+
+
+def remove_jobs_batch(policy: RetentionPolicy, session: Session, batch_size: int) -> int:
+    """
+    Archives or deletes one batch of the jobs the policy applies to, in a single transaction.
+    :return: the number of removed jobs
+    """
+    jobs = list(session.exec(stale_jobs_statement(policy, batch_size)).all())
+    if not jobs:
+        session.rollback()
+        return 0
+    job_ids = [job.id for job in jobs]
+    description_hashes = list({job.description_hash for job in jobs if job.description_hash})
+
+    if policy.action == 'archive':
+        load_job_descriptions(jobs=jobs, session=session, decompress=False)
+        # a job crawled again after it was archived keeps its first archive
+        session.execute(
+            pg_insert(JobArchive)
+            .values([
+                dict(
+                    job_id=job.id,
+                    linkedin_job_id=job.linkedin_job_id,
+                    title=job.title,
+                    company=job.company,
+                    location=job.location,
+                    url=job.url,
+                    # the archive keeps the already compressed description
+                    description=(
+                        job.description_record.content if job.description_record else compress_description("")
+                    ),
+                    posted_at=job.posted_at,
+                    created_at=job.created_at,
+                    archived_at=datetime.utcnow(),
+                    retention_policy=policy.name,
+                )
+                for job in jobs
+            ])
+            .on_conflict_do_nothing(index_elements=[JobArchive.linkedin_job_id])
+        )
+
+    # the remaining near-duplicates of a removed job become their own cluster
+    session.execute(update(Job).where(Job.cluster_id.in_(job_ids)).values(cluster_id=None))
+    session.execute(delete(JobAnalysis).where(JobAnalysis.job_id.in_(job_ids)))
+    session.execute(delete(CrawlQueryJob).where(CrawlQueryJob.job_id.in_(job_ids)))
+    session.execute(delete(Job).where(Job.id.in_(job_ids)))
+    # drop the descriptions no remaining job shares, skipping the ones locked by a concurrent insert of their jobs
+    orphan_hashes = list(session.exec(
+        select(JobDescription.hash)
+        .where(JobDescription.hash.in_(description_hashes))
+        .where(~select(Job.id).where(Job.description_hash == JobDescription.hash).exists())
+        .with_for_update(skip_locked=True)
+    ).all())
+    if orphan_hashes:
+        session.execute(delete(JobDescription).where(JobDescription.hash.in_(orphan_hashes)))
+    session.commit()
+    # the removed jobs don't need to stay in the identity map
+    session.expunge_all()
+    return len(job_ids)
+
+
+def apply_retention_policies(
+    session: Session,
+    policies: List[RetentionPolicy] = None,
+    batch_size: int = JOB_RETENTION_BATCH_SIZE,
+    max_batches: int = JOB_RETENTION_MAX_BATCHES,
+) -> Dict[str, int]:
+    """
+    Applies the retention policies to the job table, in batches so that the locks and transactions stay short.
+    :param session: the db session
+    :param policies: the policies to apply, defaults to JOB_RETENTION_POLICIES
+    :param batch_size: the number of jobs removed per transaction
+    :param max_batches: the maximum number of batches per policy, the rest is left for the next run
+    :return: the number of removed jobs per policy
+    """
+    policies = load_retention_policies() if policies is None else policies
+
+    removed_jobs = {}
+    for policy in policies:
+        removed_jobs[policy.name] = 0
+        for _ in range(max_batches):
+            removed = remove_jobs_batch(policy, session, batch_size)
+            removed_jobs[policy.name] += removed
+            if removed < batch_size:
+                break
+        logger.info(f"Retention policy {policy.name} {policy.action}d {removed_jobs[policy.name]} jobs")
+
+    return removed_jobs
+
+
+if __name__ == '__main__':
+    from backend.database.engine import get_session
+
+    with get_session() as db_session:
+        apply_retention_policies(db_session)
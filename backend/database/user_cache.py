@@ -0,0 +1,160 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+import redis
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+from backend.database.models import UserProfile
+from backend.config import logger
+from backend.constants import (
+    USER_CACHE_TTL,
+    USER_CACHE_MAX_SIZE,
+    USER_CACHE_REDIS_URL,
+    USER_CACHE_INVALIDATION_CHANNEL,
+)
+
+# seconds to wait before reconnecting the invalidation listener to Redis
+LISTENER_RECONNECT_DELAY = 5.0
+PENDING_INVALIDATIONS_KEY = 'user_cache_invalidations'
+
+
+class UserProfileCache:
+    """
+    Process-local TTL cache of the user profiles, keyed by email.
+
+    The cache holds snapshots of the profiles and returns a new detached UserProfile on every hit,
+    so the returned profiles are read-only: writes must go through a profile loaded by a session.
+    Committed writes of a UserProfile by any session invalidate its entry (see the session events below),
+    and with a Redis url the invalidations are broadcast to the caches of the other processes,
+    e.g. the status updates of the celery workers reach the API.
+    """
+
+    def __init__(self, ttl: float, max_size: int, redis_url: Optional[str] = None, channel: str = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.redis_url = redis_url
+        self.channel = channel
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        # bumped on every invalidation, a profile loaded before an invalidation is not cached
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._redis: Optional[redis.Redis] = None
+        self._listener: Optional[threading.Thread] = None
+
+    def version(self, email: str) -> int:
+        with self._lock:
+            return self._versions.get(email, 0)
+
+    def get(self, email: str) -> Optional[UserProfile]:
+        """
+        :return: a detached copy of the cached profile, None on a miss or if the entry expired
+        """
+        self._start_listener()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            cached_at, data = entry
+            if time.monotonic() - cached_at > self.ttl:
+                del self._entries[email]
+                return None
+            self._entries.move_to_end(email)
+        return UserProfile(**copy.deepcopy(data))
+
+    def set(self, user: UserProfile, version: int):
+        """
+        Caches a snapshot of the profile.
+        :param user: the profile, as loaded from the database
+        :param version: the version of the entry before the profile was loaded, see `version`
+        """
+        data = copy.deepcopy(user.model_dump())
+        with self._lock:
+            if self._versions.get(user.email, 0) != version:
+                # invalidated while the profile was loaded, the loaded profile may be outdated
+                return
+            self._entries[user.email] = (time.monotonic(), data)
+            self._entries.move_to_end(user.email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email: str, broadcast: bool = True):
+        with self._lock:
+            self._entries.pop(email, None)
+            self._versions[email] = self._versions.get(email, 0) + 1
+        if broadcast:
+            self._publish(email)
+
+    def clear(self):
+        with self._lock:
+            for email in self._entries:
+                self._versions[email] = self._versions.get(email, 0) + 1
+            self._entries.clear()
+
+    def _get_redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        return self._redis
+
+    def _publish(self, email: str):
+        if not self.redis_url:
+            return
+        try:
+            self._get_redis().publish(self.channel, email)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to broadcast the invalidation of the user cache, other processes rely on the TTL: {e}")
+
+    def _start_listener(self):
+        if not self.redis_url or self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen, name="user-cache-invalidation", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = redis.Redis.from_url(self.redis_url).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # invalidations may have been missed while disconnected
+                self.clear()
+                for message in pubsub.listen():
+                    self.invalidate(message['data'].decode(), broadcast=False)
+            except redis.RedisError as e:
+                logger.warning(f"User cache invalidation listener disconnected, reconnecting: {e}")
+                time.sleep(LISTENER_RECONNECT_DELAY)
+
+
+user_cache = UserProfileCache(
+    ttl=USER_CACHE_TTL,
+    max_size=USER_CACHE_MAX_SIZE,
+    redis_url=USER_CACHE_REDIS_URL,
+    channel=USER_CACHE_INVALIDATION_CHANNEL,
+)
+
+
+# --- Write-through invalidation ---
+# Every session, sync or async, collects the emails of the profiles it writes and invalidates them on commit.
+
+@event.listens_for(OrmSession, "after_flush")
+def collect_user_invalidations(session: OrmSession, flush_context):
+    emails: Set[str] = session.info.setdefault(PENDING_INVALIDATIONS_KEY, set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, UserProfile):
+            emails.add(instance.email)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def invalidate_committed_users(session: OrmSession):
+    for email in session.info.pop(PENDING_INVALIDATIONS_KEY, set()):
+        user_cache.invalidate(email)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def discard_user_invalidations(session: OrmSession):
+    session.info.pop(PENDING_INVALIDATIONS_KEY, None)
@@ -1,12 +1,35 @@
-from typing import List
+from typing import List, Dict, Optional, Set, Tuple
+from datetime import datetime
 
+import numpy as np
 from sqlmodel import Session, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy import inspect, or_
+from sqlalchemy.orm.attributes import set_committed_value
 
 from backend.linkedin.linkedin_wrapper import Job as LinkedInJob
-from backend.database.models import Job as JobTable, UserProfile, JobAnalysis
+from backend.database.models import (
+    Job as JobTable,
+    JobDescription,
+    UserProfile,
+    JobAnalysis,
+    AnalysisRun,
+    AnalysisStatus,
+    job_search_vector,
+)
+from backend.database.descriptions import decompress_description
+from backend.database.user_cache import user_cache
+from backend.dedup import compute_simhash, simhash_bands, find_near_duplicate
 from backend.config import logger
 from backend.constants import COUNTRY2GEOID
 
+# maximum number of rows per bulk INSERT statement
+INSERT_CHUNK_SIZE = 1000
+# columns of the job table that are set from the crawled jobs
+JOB_INSERT_COLUMNS = ('linkedin_job_id', 'title', 'company', 'location', 'url', 'posted_at', 'created_at')
+# columns of the job table returned by the insert, the search vector is not loaded with the jobs
+JOB_RETURNING_COLUMNS = [column for column in JobTable.__table__.columns if column.name != 'search_vector']
+
 def get_user(
     email: str,
     session:Session
@@ -17,53 +40,274 @@ def get_user(
 
     return user
 
+def get_cached_user(
+    email: str,
+    session: Session
+) -> UserProfile:
+    """
+    Returns the user profile from the process-local cache, loading it on a miss.
+    The returned profile is read-only, use get_user to load a profile that is modified.
+    """
+    user = user_cache.get(email)
+    if user is not None:
+        return user
+
+    version = user_cache.version(email)
+    user = get_user(email=email, session=session)
+    if user:
+        user_cache.set(user, version)
+
+    return user
+
 def insert_jobs(
     jobs: List[LinkedInJob],
     session: Session,
-) -> List[LinkedInJob]:
+) -> Tuple[List[JobTable], int]:
     """
     Bulk inserts a list of Job objects into the database.
-    Checks for duplicates based on 'linkedin_job_id' and only inserts new records.
+    Uses INSERT ... ON CONFLICT (linkedin_job_id) DO NOTHING RETURNING in chunks, so new jobs are inserted
+    and returned in a single statement per chunk, and concurrent workers inserting the same jobs don't conflict.
+    The jobs that already existed are fetched with one additional SELECT per chunk.
+    The descriptions are stored compressed in JobDescription, once per distinct description.
+    :return: all the jobs, the existing and the new ones, and the number of jobs actually inserted
     """
     logger.info(f"Starting to insert {len(jobs)} jobs")
     if not jobs:
-        return []
+        return [], 0
 
-        # 1. Extract all external IDs from the incoming list to query efficiently
-    incoming_ids = {job.linkedin_job_id for job in jobs}
-
-    # 2. Query the database to find full Job objects that already exist
-    # We fetch the full object now so we can return them with their IDs
-    statement = select(JobTable).where(JobTable.linkedin_job_id.in_(incoming_ids))
-    existing_jobs = list(session.exec(statement).all())
+    # Deduplicate the input list to prevent inserting the same job twice in one batch
+    rows_by_id = {}
+    descriptions = {}
+    for job in jobs:
+        if job.linkedin_job_id in rows_by_id:
+            continue
+        row = {column: getattr(job, column, None) for column in JOB_INSERT_COLUMNS}
+        row['created_at'] = row['created_at'] or datetime.utcnow()
+        # identical descriptions are compressed and stored once
+        description = job.description or ""
+        description_record = JobDescription.from_text(description)
+        descriptions[description_record.hash] = description_record
+        row['description_hash'] = description_record.hash
+        row['search_vector'] = job_search_vector(row['title'], row['company'], description)
+        rows_by_id[job.linkedin_job_id] = row
+    rows = list(rows_by_id.values())
 
-    # Map existing IDs for quick lookup
-    existing_ids = {job.linkedin_job_id for job in existing_jobs}
+    description_rows = [
+        {'hash': record.hash, 'content': record.content, 'created_at': record.created_at}
+        for record in descriptions.values()
+    ]
+    # the descriptions are locked until the jobs referencing them are committed, otherwise the retention
+    # could delete an already stored description, which no job references yet, before the jobs are inserted.
+    # a description deleted between the insert and the lock is inserted again
+    while description_rows:
+        locked_hashes = set()
+        for chunk_start in range(0, len(description_rows), INSERT_CHUNK_SIZE):
+            chunk = description_rows[chunk_start:chunk_start + INSERT_CHUNK_SIZE]
+            session.execute(
+                pg_insert(JobDescription)
+                .values(chunk)
+                .on_conflict_do_nothing(index_elements=[JobDescription.hash])
+            )
+            locked_hashes.update(session.exec(
+                select(JobDescription.hash)
+                .where(JobDescription.hash.in_([row['hash'] for row in chunk]))
+                .with_for_update(read=True, key_share=True)
+            ).all())
+        description_rows = [row for row in description_rows if row['hash'] not in locked_hashes]
 
-    # 3. Filter the incoming list: Keep only jobs whose IDs are NOT in the database
-    # We also deduplicate the input list to prevent inserting the same job twice in one batch
     new_jobs = []
-    seen_in_batch = set()
+    existing_jobs = []
+    for chunk_start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        chunk = rows[chunk_start:chunk_start + INSERT_CHUNK_SIZE]
+        statement = (
+            pg_insert(JobTable)
+            .values(chunk)
+            .on_conflict_do_nothing(index_elements=[JobTable.linkedin_job_id])
+            .returning(*JOB_RETURNING_COLUMNS)
+        )
+        inserted = list(session.execute(
+            select(JobTable).from_statement(statement),
+            execution_options={'populate_existing': True},
+        ).scalars().all())
+        new_jobs.extend(inserted)
 
-    for job in jobs:
-        if job.linkedin_job_id not in existing_ids and job.linkedin_job_id not in seen_in_batch:
+        inserted_ids = {job.linkedin_job_id for job in inserted}
+        conflicting_ids = [row['linkedin_job_id'] for row in chunk if row['linkedin_job_id'] not in inserted_ids]
+        if conflicting_ids:
+            existing_jobs.extend(
+                session.exec(select(JobTable).where(JobTable.linkedin_job_id.in_(conflicting_ids))).all()
+            )
+
+    # keep the returned jobs loaded, expiring them would cost one refresh query per job on the next access
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        session.commit()
+    finally:
+        session.expire_on_commit = expire_on_commit
+    logger.info(
+        f"Inserted {len(new_jobs)} new jobs with {len(descriptions)} distinct descriptions, "
+        f"{len(existing_jobs)} jobs already existed"
+    )
+
+    # Return the combined list of all jobs (existing + newly created)
+    all_jobs = existing_jobs + new_jobs
+    load_job_descriptions(jobs=all_jobs, session=session)
+    return all_jobs, len(new_jobs)
+
+def load_job_descriptions(
+    jobs: List[JobTable],
+    session: Session,
+    decompress: bool = True,
+):
+    """
+    Loads the descriptions of the jobs in bulk, with one query per chunk instead of one lazy load per job.
+    :param jobs: the jobs, the ones with a loaded description are skipped
+    :param session: the db session
+    :param decompress: decompress the descriptions in bulk, so that the agent stages read them from the decompression cache
+    :return:
+    """
+    jobs_to_load = [
+        job for job in jobs
+        if job.description_hash and 'description_record' in inspect(job).unloaded
+    ]
+    hashes = list({job.description_hash for job in jobs_to_load})
+
+    records = {}
+    for chunk_start in range(0, len(hashes), INSERT_CHUNK_SIZE):
+        chunk = hashes[chunk_start:chunk_start + INSERT_CHUNK_SIZE]
+        for record in session.exec(select(JobDescription).where(JobDescription.hash.in_(chunk))).all():
+            records[record.hash] = record
+
+    for job in jobs_to_load:
+        set_committed_value(job, 'description_record', records.get(job.description_hash))
+    if decompress:
+        for record in records.values():
+            decompress_description(record.content)
+
+def assign_near_duplicate_clusters(
+    jobs: List[JobTable],
+    session: Session,
+) -> int:
+    """
+    Fingerprints the jobs that have no SimHash yet and assigns them to the cluster of their closest
+    near-duplicate, or to a new cluster of their own if they have none.
+    :param jobs: the jobs to fingerprint, jobs that are already fingerprinted are skipped
+    :param session: the db session
+    :return: the number of jobs assigned to the cluster of an older posting
+    """
+    new_jobs = []
+    for job in sorted(jobs, key=lambda j: j.id):
+        if job.simhash is not None or not job.description:
+            continue
+        job.simhash = compute_simhash(job.title, job.company, job.description)
+        if job.simhash is not None:
             new_jobs.append(job)
-            seen_in_batch.add(job.linkedin_job_id)
 
-    # 4. Bulk insert the new jobs
-    if new_jobs:
-        logger.info(f"Inserting {len(new_jobs)} new jobs...")
-        session.add_all(new_jobs)
+    if not new_jobs:
+        return 0
+
+    band_columns = [
+        JobTable.simhash_band_0, JobTable.simhash_band_1, JobTable.simhash_band_2, JobTable.simhash_band_3
+    ]
+    band_values = [set() for _ in band_columns]
+    for job in new_jobs:
+        for band, value in enumerate(simhash_bands(job.simhash)):
+            setattr(job, band_columns[band].key, value)
+            band_values[band].add(value)
+
+    # only the postings sharing a band with a new job can be its near-duplicates, see simhash_bands,
+    # so the cost of the lookup depends on the batch rather than on the size of the table
+    new_ids = {job.id for job in new_jobs}
+    existing = [
+        (job_id, simhash, cluster_id)
+        for job_id, simhash, cluster_id in session.exec(
+            select(JobTable.id, JobTable.simhash, JobTable.cluster_id)
+            .where(or_(*(column.in_(values) for column, values in zip(band_columns, band_values))))
+        ).all()
+        if job_id not in new_ids
+    ]
+
+    # the new fingerprints are appended as they get clustered, so duplicates within the batch are found too
+    fingerprints = np.empty(len(existing) + len(new_jobs), dtype=np.int64)
+    cluster_ids = np.empty(len(existing) + len(new_jobs), dtype=np.int64)
+    for i, (job_id, simhash, cluster_id) in enumerate(existing):
+        fingerprints[i] = simhash
+        cluster_ids[i] = cluster_id or job_id
+
+    n_clustered = 0
+    n_fingerprints = len(existing)
+    for job in new_jobs:
+        match = find_near_duplicate(job.simhash, fingerprints[:n_fingerprints])
+        if match is None:
+            job.cluster_id = job.id
+        else:
+            job.cluster_id = int(cluster_ids[match])
+            n_clustered += 1
+        fingerprints[n_fingerprints] = job.simhash
+        cluster_ids[n_fingerprints] = job.cluster_id
+        n_fingerprints += 1
+        session.add(job)
+
+    # keep the jobs loaded for the caller, see insert_jobs
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
         session.commit()
+    finally:
+        session.expire_on_commit = expire_on_commit
+    logger.info(f"Fingerprinted {len(new_jobs)} jobs, {n_clustered} are near-duplicates of older postings")
+    return n_clustered
 
-        # 5. Refresh new jobs to ensure IDs and default values (like created_at) are populated from the DB
-        for job in new_jobs:
-            session.refresh(job)
-    else:
-        logger.info("No new jobs to insert.")
+def get_cluster_analyses(
+    user: UserProfile,
+    cluster_ids: Set[int],
+    session: Session,
+) -> Dict[int, JobAnalysis]:
+    """
+    Returns the analysis of an already analyzed job of each of the given near-duplicate clusters.
+    :param user: user profile
+    :param cluster_ids: the ids of the clusters
+    :param session: the db session
+    :return: the analyses keyed by cluster id
+    """
+    if not cluster_ids:
+        return {}
+
+    statement = (
+        select(JobTable.cluster_id, JobAnalysis)
+        .join(JobAnalysis, JobAnalysis.job_id == JobTable.id)
+        .where(JobAnalysis.user_id == user.id)
+        .where(JobTable.cluster_id.in_(cluster_ids))
+    )
+    return {cluster_id: analysis for cluster_id, analysis in session.exec(statement).all()}
+
+def insert_analyses(
+    analyses: List[JobAnalysis],
+    session: Session,
+) -> List[JobAnalysis]:
+    """
+    Stores the analyses of a run, skipping the ones of the jobs the retention removed during the run.
+    The jobs are locked FOR KEY SHARE until the analyses are committed, the retention skips the locked jobs.
+    :param analyses: the analyses to store
+    :param session: the db session
+    :return: the stored analyses
+    """
+    if not analyses:
+        return []
 
-    # 6. Return the combined list of all jobs (existing + newly created)
-    return existing_jobs + new_jobs
+    existing_job_ids = set(session.exec(
+        select(JobTable.id)
+        .where(JobTable.id.in_({analysis.job_id for analysis in analyses}))
+        .with_for_update(read=True, key_share=True)
+    ).all())
+    stored_analyses = [analysis for analysis in analyses if analysis.job_id in existing_job_ids]
+    if len(stored_analyses) < len(analyses):
+        logger.info(f"Skipped the analyses of {len(analyses) - len(stored_analyses)} jobs removed during the analysis")
+
+    session.add_all(stored_analyses)
+    session.commit()
+    return stored_analyses
 
 def insert_resume(
     user: UserProfile,
@@ -83,6 +327,27 @@ def insert_resume(
     session.commit()
     logger.info(f"Resume inserted into user profile: {user}")
 
+def insert_resume_profile(
+    user: UserProfile,
+    resume_profile: dict,
+    resume_hash: str,
+    session: Session,
+):
+    """
+    Inserts the profile distilled from the resume into the user profile.
+    :param user: user profile
+    :param resume_profile: the resume profile
+    :param resume_hash: the hash of the resume the profile was distilled from
+    :param session: the db session
+    :return:
+    """
+    logger.info(f"Inserting resume profile into user profile: {user.email}")
+    user.resume_profile = resume_profile
+    user.resume_profile_hash = resume_hash
+    session.add(user)
+    session.commit()
+    logger.info(f"Resume profile inserted into user profile: {user.email}")
+
 def insert_user_instructions(
     user: UserProfile,
     user_instructions: str,
@@ -101,6 +366,18 @@ def insert_user_instructions(
     session.commit()
     logger.info(f"User instructions inserted into user profile: {user}")
 
+def supported_countries(countries: List[str]) -> List[str]:
+    """
+    Returns the countries that are supported for the job search, logging the unsupported ones.
+    """
+    valid_countries = []
+    for country in countries:
+        if country not in COUNTRY2GEOID.keys():
+            logger.warning(f"Country '{country}' is not supported, skipping.")
+            continue
+        valid_countries.append(country)
+    return valid_countries
+
 def insert_user_job_search_countries(
     user: UserProfile,
     job_search_countries: List[str],
@@ -114,17 +391,10 @@ def insert_user_job_search_countries(
     :param session: the db session
     :return:
     """
-    valid_countries = []
     logger.info(f"Updating job search countries for user: {user.email}")
-    
-    for country in job_search_countries:
-        if country not in COUNTRY2GEOID.keys():
-            logger.warning(f"Country '{country}' is not supported, skipping.")
-            continue
-        valid_countries.append(country)
-    
+
     # Overwrite with the new valid list
-    user.job_countries = valid_countries
+    user.job_countries = supported_countries(job_search_countries)
 
     session.add(user)
     session.commit()
@@ -185,3 +455,69 @@ def update_job_applied_status(
         logger.info("Applied status updated.")
     else:
         logger.warning("JobAnalysis record not found for this user/job combination.")
+
+def create_analysis_run(
+    user: UserProfile,
+    task_id: Optional[str],
+    session: Session,
+) -> AnalysisRun:
+    """
+    Creates the accounting record of a new analysis run.
+    :param user: user profile
+    :param task_id: the id of the celery task running the analysis
+    :param session: the db session
+    :return: the analysis run
+    """
+    analysis_run = AnalysisRun(user_id=user.id, task_id=task_id)
+    session.add(analysis_run)
+    session.commit()
+    session.refresh(analysis_run)
+    logger.info(f"Started analysis run {analysis_run.id} for user {user.email}")
+    return analysis_run
+
+def finish_analysis_run(
+    analysis_run: AnalysisRun,
+    status: AnalysisStatus,
+    stage_summaries: Dict[str, dict],
+    session: Session,
+    jobs_crawled: int = 0,
+    jobs_analyzed: int = 0,
+    jobs_relevant: int = 0,
+    jobs_inherited: int = 0,
+):
+    """
+    Stores the outcome and the LLM usage of an analysis run.
+    :param analysis_run: the analysis run
+    :param status: the final status of the run
+    :param stage_summaries: the LLM usage summary per stage, as returned by LLMCallTracker.summary
+    :param session: the db session
+    :param jobs_crawled: the number of jobs retrieved from LinkedIn
+    :param jobs_analyzed: the number of jobs sent to the agents
+    :param jobs_relevant: the number of jobs found relevant, including the inherited ones
+    :param jobs_inherited: the number of jobs whose analysis was copied from a near-duplicate
+    :return:
+    """
+    analysis_run.status = status
+    analysis_run.finished_at = datetime.utcnow()
+    analysis_run.jobs_crawled = jobs_crawled
+    analysis_run.jobs_analyzed = jobs_analyzed
+    analysis_run.jobs_relevant = jobs_relevant
+    analysis_run.jobs_inherited = jobs_inherited
+    analysis_run.stages = stage_summaries
+
+    summaries = stage_summaries.values()
+    analysis_run.llm_calls = sum(summary['calls'] for summary in summaries)
+    analysis_run.failed_llm_calls = sum(summary['failed_calls'] for summary in summaries)
+    analysis_run.input_tokens = sum(summary['input_tokens'] for summary in summaries)
+    analysis_run.cached_input_tokens = sum(summary['cached_input_tokens'] for summary in summaries)
+    analysis_run.output_tokens = sum(summary['output_tokens'] for summary in summaries)
+    analysis_run.llm_latency = sum(summary['llm_latency'] for summary in summaries)
+    analysis_run.cost_usd = sum(summary['cost_usd'] for summary in summaries)
+
+    session.add(analysis_run)
+    session.commit()
+    logger.info(
+        f"Finished analysis run {analysis_run.id} with status {status}: {analysis_run.llm_calls} LLM calls, "
+        f"{analysis_run.input_tokens} input tokens ({analysis_run.cached_input_tokens} cached), "
+        f"{analysis_run.output_tokens} output tokens, ${analysis_run.cost_usd:.4f}"
+    )
@@ -0,0 +1 @@
+from backend.dedup.simhash import compute_simhash, simhash_bands, find_near_duplicate, group_near_duplicates
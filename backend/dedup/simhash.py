@@ -0,0 +1,100 @@
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.database.models import Job
+from backend.ranking.relevance import tokenize
+
+SIMHASH_BITS = 64
+# maximum number of differing bits for two postings to be near-duplicates
+MAX_HAMMING_DISTANCE = 3
+# the fingerprint is split into MAX_HAMMING_DISTANCE + 1 bands, by the pigeonhole principle
+# two fingerprints within MAX_HAMMING_DISTANCE are equal in at least one band
+SIMHASH_BANDS = MAX_HAMMING_DISTANCE + 1
+SIMHASH_BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+# descriptions shorter than this are too generic to be fingerprinted reliably
+MIN_DESCRIPTION_TOKENS = 30
+SHINGLE_SIZE = 3
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def to_signed(value: int) -> int:
+    """
+    Converts an unsigned 64 bit integer to a signed one so that it fits into a BIGINT column.
+    """
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def simhash_bands(fingerprint: int) -> Tuple[int, ...]:
+    """
+    Splits a signed fingerprint into its SIMHASH_BANDS unsigned bands, lowest bits first.
+    """
+    mask = (1 << SIMHASH_BAND_BITS) - 1
+    return tuple((fingerprint >> (band * SIMHASH_BAND_BITS)) & mask for band in range(SIMHASH_BANDS))
+
+
+def compute_simhash(title: str, company: str, description: str) -> Optional[int]:
+    """
+    Computes the SimHash fingerprint of a posting over its normalised title, company and description.
+    The description contributes word shingles, the title and company contribute whole, so two postings
+    are near-duplicates only if they share the title and company and have a near-identical description.
+    :return: the signed 64 bit fingerprint, None if the description is too short to be fingerprinted
+    """
+    description_tokens = tokenize(description)
+    if len(description_tokens) < MIN_DESCRIPTION_TOKENS:
+        return None
+
+    features = [
+        ' '.join(description_tokens[i:i + SHINGLE_SIZE])
+        for i in range(len(description_tokens) - SHINGLE_SIZE + 1)
+    ]
+    # weight the title and company like a large part of the description
+    header_weight = max(1, len(features) // 4)
+    weights = [1] * len(features)
+    features += [f"title:{' '.join(tokenize(title))}", f"company:{' '.join(tokenize(company))}"]
+    weights += [header_weight, header_weight]
+
+    hashes = np.array([_feature_hash(feature) for feature in features], dtype=np.uint64)
+    bits = (hashes[:, None] >> np.arange(SIMHASH_BITS, dtype=np.uint64)) & np.uint64(1)
+    votes = np.asarray(weights, dtype=np.int64) @ np.where(bits == 1, 1, -1)
+
+    fingerprint = 0
+    for bit in np.flatnonzero(votes > 0):
+        fingerprint |= 1 << int(bit)
+    return to_signed(fingerprint)
+
+
+def find_near_duplicate(fingerprint: int, fingerprints: np.ndarray) -> Optional[int]:
+    """
+    Finds the closest near-duplicate of a fingerprint.
+    :param fingerprint: the signed fingerprint to look for
+    :param fingerprints: the signed fingerprints to search in, as an int64 array
+    :return: the index of the closest fingerprint within MAX_HAMMING_DISTANCE, None if there is none
+    """
+    if len(fingerprints) == 0:
+        return None
+    distances = np.bitwise_count(fingerprints.view(np.uint64) ^ np.int64(fingerprint).view(np.uint64))
+    closest = int(np.argmin(distances))
+    return closest if distances[closest] <= MAX_HAMMING_DISTANCE else None
+
+
+def group_near_duplicates(jobs: List[Job]) -> Tuple[List[Job], Dict[int, List[Job]]]:
+    """
+    Groups the jobs by their near-duplicate cluster.
+    :return: one representative job per cluster, and the other jobs of the cluster keyed by the representative's id
+    """
+    representatives: Dict[int, Job] = {}
+    duplicates: Dict[int, List[Job]] = {}
+    for job in jobs:
+        cluster_id = job.cluster_id or job.id
+        representative = representatives.get(cluster_id)
+        if representative is None:
+            representatives[cluster_id] = job
+        else:
+            duplicates.setdefault(representative.id, []).append(job)
+
+    return list(representatives.values()), duplicates
@@ -17,7 +17,8 @@ from backend.constants import (
 from backend.utils import (
     ahttp_with_retry,
     async_with_concurrency,
-    SingletonMeta
+    SingletonMeta,
+    background_loop,
 )
 from backend.APIs.schemas import Job
 from backend.config import logger
@@ -36,16 +37,32 @@ class LinkedinWrapper(metaclass=SingletonMeta):
                     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
                     "Accept-Language": "en-US,en;q=0.5",
                 }
+            # client shared by the calls running on the background event loop, see _get_client
+            self._client: Optional[httpx.AsyncClient] = None
             self.initialized = True
 
     @asynccontextmanager
     async def _get_client(self, provided_client: Optional[httpx.AsyncClient]):
         if provided_client:
             yield provided_client
+        elif background_loop.is_running() and asyncio.get_running_loop() is background_loop.loop:
+            # the crawls of the worker run on its persistent event loop, they share one client and its connection pool,
+            # so the TLS connections are reused across the crawled queries and the tasks
+            if self._client is None or self._client.is_closed:
+                self._client = httpx.AsyncClient(headers=self.headers)
+            yield self._client
         else:
             async with httpx.AsyncClient(headers=self.headers) as client:
                 yield client
 
+    async def aclose(self):
+        """
+        Closes the shared client, on the background event loop before it is stopped.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     @staticmethod
     def map_loc2ids(location: str) -> Tuple[int, List[int]]:
         """
@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import or_, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select, update
+
+from backend.database.models import CrawlQuery, CrawlQueryJob, Job, UserProfile
+from backend.database.utils import insert_jobs, assign_near_duplicate_clusters, INSERT_CHUNK_SIZE
+from backend.linkedin import LinkedinWrapper
+from backend.queue.progress import AnalysisProgress
+from backend.utils import run_async
+from backend.config import logger
+from backend.constants import CRAWL_FRESHNESS_WINDOW, CRAWL_LEASE_TIMEOUT, CRAWL_TIME_FILTER_OVERLAP
+
+# (normalized title, country)
+QueryKey = Tuple[str, str]
+
+
+class ClaimedQuery(BaseModel):
+    id: int
+    title: str
+    country: str
+    # seconds since the previous crawl of the query, with an overlap, None on the first crawl
+    time_filter: Optional[int] = None
+    claimed_at: datetime
+
+
+def normalize_title(title: str) -> str:
+    """
+    Normalizes a job title so that the same search of different users maps to a single query.
+    """
+    return ' '.join(title.split()).lower()
+
+
+def user_queries(user: UserProfile) -> Set[QueryKey]:
+    return {
+        (normalize_title(title), country)
+        for title in user.job_titles if title.strip()
+        for country in user.job_countries
+    }
+
+
+def claim_stale_queries(queries: Iterable[QueryKey], session: Session) -> List[ClaimedQuery]:
+    """
+    Claims the queries that are not fresh and not being crawled by another worker.
+    The claim is a single conditional UPDATE, so concurrent workers never claim the same query.
+    :param queries: the queries to crawl
+    :param session: the db session
+    :return: the claimed queries, to be crawled and then released with `finish_crawl` or `release_crawls`
+    """
+    queries = sorted(set(queries))
+    if not queries:
+        return []
+
+    now = datetime.utcnow()
+    session.execute(
+        pg_insert(CrawlQuery)
+        .values([{'title': title, 'country': country, 'jobs_found': 0} for title, country in queries])
+        .on_conflict_do_nothing(index_elements=[CrawlQuery.title, CrawlQuery.country])
+    )
+    stale_before = now - timedelta(seconds=CRAWL_FRESHNESS_WINDOW)
+    lease_expired_before = now - timedelta(seconds=CRAWL_LEASE_TIMEOUT)
+    rows = session.execute(
+        update(CrawlQuery)
+        .where(tuple_(CrawlQuery.title, CrawlQuery.country).in_(queries))
+        .where(or_(CrawlQuery.last_crawled_at.is_(None), CrawlQuery.last_crawled_at < stale_before))
+        .where(or_(CrawlQuery.crawl_started_at.is_(None), CrawlQuery.crawl_started_at < lease_expired_before))
+        .values(crawl_started_at=now)
+        .returning(CrawlQuery.id, CrawlQuery.title, CrawlQuery.country, CrawlQuery.last_crawled_at)
+    ).all()
+    session.commit()
+
+    claimed = []
+    for query_id, title, country, last_crawled_at in rows:
+        time_filter = None
+        if last_crawled_at:
+            time_filter = int((now - last_crawled_at).total_seconds()) + CRAWL_TIME_FILTER_OVERLAP
+        claimed.append(ClaimedQuery(id=query_id, title=title, country=country, time_filter=time_filter, claimed_at=now))
+
+    logger.info(f"Claimed {len(claimed)} of {len(queries)} queries, the others are fresh or being crawled")
+    return claimed
+
+
+def finish_crawl(query: ClaimedQuery, jobs_found: int, session: Session):
+    """
+    Marks the query as crawled at the time it was claimed,
+    the time filter of the next crawl then covers the jobs posted during this crawl.
+    """
+    session.execute(
+        update(CrawlQuery)
+        .where(CrawlQuery.id == query.id)
+        .values(last_crawled_at=query.claimed_at, crawl_started_at=None, jobs_found=jobs_found)
+    )
+    session.commit()
+
+
+def link_query_jobs(query: ClaimedQuery, job_ids: List[int], session: Session):
+    """
+    Records that the crawl of the query found the jobs, the new ones as well as the already stored ones.
+    """
+    if not job_ids:
+        return
+    for chunk_start in range(0, len(job_ids), INSERT_CHUNK_SIZE):
+        session.execute(
+            pg_insert(CrawlQueryJob)
+            .values([
+                {'crawl_query_id': query.id, 'job_id': job_id}
+                for job_id in job_ids[chunk_start:chunk_start + INSERT_CHUNK_SIZE]
+            ])
+            .on_conflict_do_nothing(index_elements=[CrawlQueryJob.crawl_query_id, CrawlQueryJob.job_id])
+        )
+
+
+def query_jobs_statement(queries: Iterable[QueryKey]):
+    """
+    Builds the statement selecting the ids of the jobs found by the queries.
+    """
+    return (
+        select(CrawlQueryJob.job_id)
+        .join(CrawlQuery, CrawlQuery.id == CrawlQueryJob.crawl_query_id)
+        .where(tuple_(CrawlQuery.title, CrawlQuery.country).in_(sorted(set(queries))))
+    )
+
+
+def release_crawls(queries: List[ClaimedQuery], session: Session):
+    """
+    Releases the queries whose crawl failed, so that the next worker crawls them again.
+    """
+    session.rollback()
+    session.execute(
+        update(CrawlQuery)
+        .where(CrawlQuery.id.in_([query.id for query in queries]))
+        .values(crawl_started_at=None)
+    )
+    session.commit()
+
+
+def crawl_queries(
+    queries: Iterable[QueryKey],
+    session: Session,
+    linkedin_wrapper: Optional[LinkedinWrapper] = None,
+    progress: Optional[AnalysisProgress] = None,
+) -> Tuple[Dict[QueryKey, List[Job]], int]:
+    """
+    Crawls the stale queries once for all the users searching them and inserts the crawled jobs.
+    The fresh queries were crawled recently, for this or another user, and their jobs are already stored.
+    The queries being crawled by another worker are skipped, their jobs are picked up by the next analysis.
+    :param queries: the queries to crawl
+    :param session: the db session
+    :param linkedin_wrapper: the LinkedIn wrapper
+    :param progress: optional progress of the analysis run the queries are crawled for
+    :return: the stored jobs per crawled query, and the number of jobs the crawls newly inserted
+    """
+    if linkedin_wrapper is None:
+        linkedin_wrapper = LinkedinWrapper()
+
+    jobs_by_query: Dict[QueryKey, List[Job]] = {}
+    n_crawled = 0
+    n_inserted = 0
+    claimed = claim_stale_queries(queries, session)
+    for i, query in enumerate(claimed):
+        try:
+            logger.info(f"Crawling '{query.title}' in {query.country} in the timespan of {query.time_filter}")
+            crawled_jobs = run_async(
+                linkedin_wrapper.get_all_jobs_details(
+                    keywords=query.title,
+                    location=query.country,
+                    time_filter=query.time_filter,
+                )
+            )
+            crawled_jobs = [job for job in crawled_jobs if not isinstance(job, BaseException)]
+            # stored before the query is marked as crawled, a failed crawl is retried as a whole
+            jobs, n_new = insert_jobs(jobs=crawled_jobs, session=session)
+            # read before the clustering commits, reading the id of an expired job refreshes it with a query per job
+            job_ids = [job.id for job in jobs]
+            assign_near_duplicate_clusters(jobs=jobs, session=session)
+            link_query_jobs(query, job_ids, session)
+        except Exception:
+            # the remaining queries are released as well, rather than waiting for their lease to expire
+            release_crawls(claimed[i:], session)
+            raise
+
+        finish_crawl(query, jobs_found=len(jobs), session=session)
+        jobs_by_query[(query.title, query.country)] = jobs
+        n_crawled += len(crawled_jobs)
+        n_inserted += n_new
+        if progress:
+            progress.publish('crawling', jobs_crawled=n_crawled, jobs_inserted=n_inserted)
+
+    return jobs_by_query, n_inserted
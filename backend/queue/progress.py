@@ -0,0 +1,121 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Awaitable, Optional, TypeVar, TYPE_CHECKING
+
+import redis
+
+from backend.config import logger
+from backend.constants import (
+    REDIS_URL,
+    ANALYSIS_EVENTS_CHANNEL_PREFIX,
+    ANALYSIS_EVENTS_TTL,
+    ANALYSIS_PROGRESS_INTERVAL,
+)
+
+if TYPE_CHECKING:
+    from backend.agents.call_tracker import LLMCallTracker
+
+T = TypeVar('T')
+
+# stages after which no more events are published for the run
+TERMINAL_STAGES = {'completed', 'failed'}
+
+
+def analysis_events_channel(user_email: str) -> str:
+    return f"{ANALYSIS_EVENTS_CHANNEL_PREFIX}:{user_email}"
+
+
+def latest_analysis_event_key(user_email: str) -> str:
+    return f"{ANALYSIS_EVENTS_CHANNEL_PREFIX}:{user_email}:latest"
+
+
+class AnalysisProgress:
+    """
+    Publishes the progress of an analysis run to the Redis channel of the user.
+    Every event carries the full state of the run, so a client only needs the latest event,
+    which is also stored in a key for the clients that connect in the middle of the run.
+    Publishing never fails the analysis, the errors are logged.
+    """
+
+    def __init__(self, user_email: str, task_id: Optional[str] = None, redis_url: str = REDIS_URL):
+        self.user_email = user_email
+        self.started_at = time.monotonic()
+        self.state = {
+            'task_id': task_id,
+            'stage': 'started',
+            'jobs_crawled': None,
+            'jobs_inserted': None,
+            'jobs_inherited': None,
+            'jobs_to_analyze': None,
+            'jobs_shortlisted': None,
+            'jobs_relevant': None,
+            # progress of the current agent stage
+            'done': None,
+            'total': None,
+            'eta_seconds': None,
+        }
+        self._redis = redis.Redis.from_url(redis_url, socket_timeout=1.0, socket_connect_timeout=1.0)
+
+    def publish(self, stage: str, **counts):
+        """
+        Publishes an event of the run.
+        :param stage: the current stage, e.g. 'crawling', 'shortlisting', 'completed'
+        :param counts: the counts of the run to update, e.g. jobs_crawled=120
+        """
+        self._send(self._event(stage, **counts))
+
+    async def apublish(self, stage: str, **counts):
+        """
+        Publishes an event of the run from a coroutine, the blocking Redis calls run in a thread
+        so that they don't stall the event loop running the agents.
+        """
+        await asyncio.to_thread(self._send, self._event(stage, **counts))
+
+    def _event(self, stage: str, **counts) -> str:
+        self.state.update(stage=stage, **counts)
+        return json.dumps({
+            **self.state,
+            'elapsed_seconds': round(time.monotonic() - self.started_at, 1),
+            'timestamp': datetime.utcnow().isoformat(),
+        })
+
+    def _send(self, event: str):
+        try:
+            pipeline = self._redis.pipeline(transaction=False)
+            pipeline.set(latest_analysis_event_key(self.user_email), event, ex=ANALYSIS_EVENTS_TTL)
+            pipeline.publish(analysis_events_channel(self.user_email), event)
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to publish the analysis progress of {self.user_email}: {e}")
+
+    async def report_agent_stage(self, stage: str, call_tracker: "LLMCallTracker", total: int):
+        """
+        Publishes the progress of an agent stage every ANALYSIS_PROGRESS_INTERVAL seconds until cancelled,
+        with the ETA extrapolated from the rate of the completed LLM calls.
+        """
+        stage_started_at = time.monotonic()
+        while True:
+            done = min(sum(1 for call in call_tracker.calls if not call.failed), total)
+            elapsed = time.monotonic() - stage_started_at
+            eta = (total - done) * elapsed / done if done else None
+            await self.apublish(stage, done=done, total=total, eta_seconds=round(eta, 1) if eta is not None else None)
+            await asyncio.sleep(ANALYSIS_PROGRESS_INTERVAL)
+
+    async def track_agent_stage(
+        self,
+        stage: str,
+        call_tracker: "LLMCallTracker",
+        total: int,
+        coroutine: Awaitable[T],
+    ) -> T:
+        """
+        Awaits the agent stage while reporting its progress.
+        """
+        reporter = asyncio.create_task(self.report_agent_stage(stage, call_tracker, total))
+        try:
+            return await coroutine
+        finally:
+            reporter.cancel()
+            self.state.update(done=None, total=None, eta_seconds=None)
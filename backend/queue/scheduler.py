@@ -0,0 +1,65 @@
+import hashlib
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import or_
+from sqlmodel import Session, select, update
+
+from backend.database.models import UserProfile
+from backend.config import logger
+from backend.constants import USER_REFRESH_INTERVAL, USER_REFRESH_JITTER, USER_REFRESH_BATCH_SIZE
+
+
+def initial_refresh_at(user_id: int, now: datetime, interval: float = USER_REFRESH_INTERVAL) -> datetime:
+    """
+    First refresh of a user, at a fixed offset within the interval derived from the user id,
+    so that the users without a schedule, e.g. right after a deploy, are spread over the interval instead of all due now.
+    """
+    offset = int(hashlib.sha256(str(user_id).encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return now + timedelta(seconds=offset * interval)
+
+
+def next_refresh_at(now: datetime, interval: float = USER_REFRESH_INTERVAL, jitter: float = USER_REFRESH_JITTER) -> datetime:
+    """
+    Next refresh of a user, one interval from now, randomly stretched or shrunk by up to the jitter fraction.
+    """
+    return now + timedelta(seconds=interval * (1 + random.uniform(-jitter, jitter)))
+
+
+def claim_due_users(session: Session, batch_size: int = USER_REFRESH_BATCH_SIZE) -> List[UserProfile]:
+    """
+    Returns the users whose refresh is due and schedules their next refresh, in a single transaction.
+    The users without a schedule are only scheduled, see `initial_refresh_at`.
+    The rows are locked, skipping the ones locked by a concurrent scheduler run.
+    :param session: the db session
+    :param batch_size: the maximum number of users to return, the others are due on the next run
+    :return: the users to refresh
+    """
+    now = datetime.utcnow()
+    users = list(session.exec(
+        select(UserProfile)
+        .where(or_(UserProfile.next_refresh_at.is_(None), UserProfile.next_refresh_at <= now))
+        .order_by(UserProfile.next_refresh_at.asc().nulls_last())
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all())
+
+    due_users = []
+    for user in users:
+        if user.next_refresh_at is None:
+            refresh_at = initial_refresh_at(user.id, now)
+        else:
+            refresh_at = next_refresh_at(now)
+            # users without searches have nothing to refresh
+            if user.job_titles and user.job_countries:
+                due_users.append(user)
+        session.execute(
+            update(UserProfile)
+            .where(UserProfile.id == user.id)
+            .values(next_refresh_at=refresh_at)
+        )
+    session.commit()
+
+    logger.info(f"{len(due_users)} of {len(users)} scheduled users are due for a refresh")
+    return due_users
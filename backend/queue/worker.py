@@ -1,84 +1,312 @@
 import json
-from typing import List
-from datetime import datetime
+from importlib import import_module
+from typing import Dict, Optional, TYPE_CHECKING
+from datetime import datetime, timedelta
 from pathlib import Path
 
 from celery import Celery
+from celery.result import AsyncResult
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
 from sqlmodel import select
 
-from backend.database.init_db import get_session
+from backend.database.engine import get_session, dispose_engine_after_fork
+from backend.database.retention import apply_retention_policies
 from backend.database.models import JobAnalysis, UserProfile, Job, AnalysisStatus
-from backend.database.utils import insert_jobs, get_user
+from backend.database.utils import (
+    get_user,
+    insert_resume_profile,
+    create_analysis_run,
+    finish_analysis_run,
+    get_cluster_analyses,
+    load_job_descriptions,
+    insert_analyses,
+)
+from backend.utils import run_async, background_loop
+from backend.queue.progress import AnalysisProgress
 from backend.linkedin import LinkedinWrapper
-from backend.utils import run_async
-from backend.agents.job_short_lister.shortlist_jobs import shortlist_jobs
-from backend.agents.job_filterer.filter_jobs import filter_jobs
+from backend.queue.crawl_plan import crawl_queries, user_queries, query_jobs_statement
+from backend.queue.scheduler import claim_due_users
+from backend.ranking import rank_jobs
+from backend.dedup import group_near_duplicates
 from backend.config import logger
+from backend.constants import (
+    ANALYSIS_LLM_BUDGET,
+    ANALYSIS_STALE_TIMEOUT,
+    JOB_RETENTION_INTERVAL,
+    USER_REFRESH_INTERVAL,
+    USER_REFRESH_SCHEDULER_INTERVAL,
+    USER_REFRESH_LLM_BUDGET,
+    REDIS_URL,
+)
+
+if TYPE_CHECKING:
+    from backend.agents.call_tracker import LLMCallTracker
+
+# The agents pull in the whole LLM stack (LangChain, OpenAI), which takes seconds to import.
+# They are imported where they are used, so that the API, which imports this module to enqueue the tasks,
+# and the scripts don't pay for them. The worker preloads them once, see preload_agents.
+AGENT_MODULES = (
+    'backend.agents.call_tracker',
+    'backend.agents.resume_profiler.profile_resume',
+    'backend.agents.job_short_lister.shortlist_jobs',
+    'backend.agents.job_filterer.filter_jobs',
+)
 
 # Setup Celery
 # Broker: Redis (for queueing tasks)
 # Backend: Redis (for storing results if needed, though we write to Postgres)
 celery_app = Celery(
     "worker",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0"
+    broker=REDIS_URL,
+    backend=REDIS_URL
 )
 
-def get_all_jobs(
-    linkedin_wrapper: LinkedinWrapper,
-    job_titles: List[str],
-    job_countries: List[str],
-    time_filter: int = None
-) -> List[Job]:
-    all_jobs = []
-    for title in job_titles:
-        for country in job_countries:
-            jobs = run_async(
-                linkedin_wrapper.get_all_jobs_details(
-                    keywords=title,
-                    location=country,
-                    time_filter=time_filter,
-                )
-            )
-            all_jobs.extend(jobs)
+# Periodic tasks, run by `celery beat`
+celery_app.conf.beat_schedule = {
+    "apply-job-retention": {
+        "task": "apply_retention_task",
+        "schedule": JOB_RETENTION_INTERVAL,
+    },
+}
+if USER_REFRESH_INTERVAL:
+    # small and continuous refreshes, staggered between the users, rather than one crawl of every search at once
+    celery_app.conf.beat_schedule["schedule-user-refreshes"] = {
+        "task": "schedule_user_refreshes_task",
+        "schedule": USER_REFRESH_SCHEDULER_INTERVAL,
+    }
+
+@worker_init.connect
+def preload_agents(**kwargs):
+    """
+    Imports the agents in the main worker process, before the pool is forked,
+    so that the children share the imported modules instead of importing them on their first task.
+    """
+    for module in AGENT_MODULES:
+        import_module(module)
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """
+    Prefork children inherit the connections pooled by the parent before the fork,
+    sharing a connection between processes corrupts it, so every child starts with an empty pool.
+    Every child also starts its own event loop, the tasks run their coroutines on it through run_async
+    so that the async clients and their connections are reused across the calls and the tasks.
+    """
+    dispose_engine_after_fork()
+    background_loop.start()
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    # the shared HTTP client of the crawls is bound to the loop, it is closed before the loop
+    run_async(LinkedinWrapper().aclose())
+    background_loop.stop()
+
+def get_filter_resume(
+    user: UserProfile,
+    session,
+    call_tracker: Optional["LLMCallTracker"] = None,
+) -> str:
+    """
+    Returns the compact resume profile used by the job filterer.
+    The profile is distilled again if it is missing or was distilled from an older resume,
+    and the raw resume is returned if the distillation fails.
+    """
+    from backend.agents.resume_profiler.profile_resume import profile_resume
+    from backend.agents.resume_profiler.agent import ResumeProfile, hash_resume, format_resume_profile
+
+    if not user.resume_text:
+        return user.resume_text
 
-    # convert to correct job format from the DB
-    all_jobs = [Job(**job.model_dump()) for job in all_jobs]
-    return all_jobs
+    resume_hash = hash_resume(user.resume_text)
+    if user.resume_profile and user.resume_profile_hash == resume_hash:
+        return format_resume_profile(ResumeProfile(**user.resume_profile))
+
+    logger.info(f"Resume profile of {user.email} is outdated, distilling the resume")
+    try:
+        profile = run_async(profile_resume(user.resume_text, call_tracker=call_tracker))
+    except Exception as exc:
+        logger.warning(f"Failed to distill the resume, using the raw resume: {exc}")
+        return user.resume_text
+    if not profile:
+        logger.warning("Failed to distill the resume, using the raw resume")
+        return user.resume_text
+
+    insert_resume_profile(
+        user=user,
+        resume_profile=profile.model_dump(),
+        resume_hash=resume_hash,
+        session=session
+    )
+    return format_resume_profile(profile)
 
 
-async def async_analysis_pipeline(user, jobs_to_process):
+def new_call_trackers() -> Dict[str, "LLMCallTracker"]:
+    """
+    Returns one LLM call tracker per stage of the analysis.
+    """
+    from backend.agents.call_tracker import LLMCallTracker
+
+    return {
+        stage: LLMCallTracker(stage=stage)
+        for stage in ('resume_profiler', 'job_short_lister', 'job_filterer')
+    }
+
+
+def summarize_call_trackers(call_trackers: Dict[str, "LLMCallTracker"]) -> Dict[str, dict]:
+    """
+    Returns the LLM usage summary per stage, with the prompt version of the agent of the stage,
+    so that the runs can be compared across prompt changes.
+    """
+    from backend.agents.registry import agent_registry
+
+    prompt_versions = agent_registry.prompt_versions()
+    return {
+        stage: {**tracker.summary(), 'prompt_version': prompt_versions.get(stage)}
+        for stage, tracker in call_trackers.items() if tracker.calls
+    }
+
+
+async def async_analysis_pipeline(
+    user,
+    jobs_to_process,
+    resume: str,
+    call_trackers: Optional[Dict[str, "LLMCallTracker"]] = None,
+    progress: Optional[AnalysisProgress] = None,
+):
+    """
+    Shortlists and then filters the jobs.
+    :return: the relevant jobs, their relevancy reasons and the jobs discarded by either agent
+    """
+    from backend.agents.job_short_lister.shortlist_jobs import shortlist_jobs
+    from backend.agents.job_filterer.filter_jobs import filter_jobs
+
+    if call_trackers is None:
+        call_trackers = new_call_trackers()
+
     logger.info("Starting to shortlist jobs")
-    jobs_shortlist = await shortlist_jobs(
+    shortlisting = shortlist_jobs(
         jobs=jobs_to_process,
         user_instructions=user.filter_instructions,
+        call_tracker=call_trackers['job_short_lister'],
     )
+    if progress:
+        shortlisting = progress.track_agent_stage(
+            'shortlisting', call_trackers['job_short_lister'], len(jobs_to_process), shortlisting
+        )
+    jobs_shortlist, shortlister_discarded_jobs = await shortlisting
     logger.info("Successfully finished shortlisting jobs")
-    
+    if progress:
+        await progress.apublish('shortlisted', jobs_shortlisted=len(jobs_shortlist))
+
     logger.info("Starting to filter jobs")
-    return await filter_jobs(
+    filtering = filter_jobs(
         jobs=jobs_shortlist,
         user_instructions=user.filter_instructions,
-        resume=user.resume_text,
+        resume=resume,
+        call_tracker=call_trackers['job_filterer'],
     )
+    if progress:
+        filtering = progress.track_agent_stage(
+            'filtering', call_trackers['job_filterer'], len(jobs_shortlist), filtering
+        )
+    filtered_jobs, relevancy_reasons, filterer_discarded_jobs = await filtering
+    return filtered_jobs, relevancy_reasons, shortlister_discarded_jobs + filterer_discarded_jobs
+
+@celery_app.task(name="profile_resume_task")
+def profile_resume_task(user_email: str):
+    """
+    Background task to distill the user's resume into a compact profile.
+    """
+    session = get_session()
+    try:
+        user = get_user(
+            email=user_email,
+            session=session
+        )
+        if not user:
+            logger.warning(f"No user with email {user_email}")
+            return "User not found"
+
+        get_filter_resume(user, session)
+        return f"Resume profile of {user_email} is up to date."
+    finally:
+        session.close()
+
+@celery_app.task(name="apply_retention_task")
+def apply_retention_task():
+    """
+    Periodic task to archive or delete the stale jobs no user is interested in,
+    so that the job table and its indexes only hold the jobs that are still useful.
+    """
+    with get_session() as session:
+        removed_jobs = apply_retention_policies(session)
+    return f"Removed {sum(removed_jobs.values())} stale jobs."
+
+@celery_app.task(name="schedule_user_refreshes_task")
+def schedule_user_refreshes_task():
+    """
+    Periodic task to queue the refresh of the users that are due, see backend/queue/scheduler.py.
+    A refresh is a regular analysis, it only crawls the searches that are not fresh
+    and only analyzes the jobs of the searches of the user without an analysis, the rejected ones included,
+    at most USER_REFRESH_LLM_BUDGET of them, so every run is small.
+    """
+    with get_session() as session:
+        queued = 0
+        for user in claim_due_users(session):
+            queued += enqueue_analysis(user, session, llm_budget=USER_REFRESH_LLM_BUDGET) is not None
+    return f"Queued the refresh of {queued} users."
+
+def enqueue_analysis(user: UserProfile, session, llm_budget: Optional[int] = ANALYSIS_LLM_BUDGET) -> Optional[str]:
+    """
+    Queues an analysis of the user, unless one is already queued or running.
+    An analysis queued more than ANALYSIS_STALE_TIMEOUT ago is considered lost and replaced.
+    :param user: the user to analyze
+    :param session: the db session
+    :param llm_budget: the maximum number of jobs sent to the agents, see analyze_jobs_task
+    :return: the id of the queued task, None if an analysis is already queued or running
+    """
+    if user.analysis_task_id:
+        existing_task = AsyncResult(user.analysis_task_id, app=celery_app)
+        # blocked states: PENDING, STARTED, RETRY
+        if existing_task.state in {"PENDING", "STARTED", "RETRY"}:
+            stale_before = datetime.utcnow() - timedelta(seconds=ANALYSIS_STALE_TIMEOUT)
+            if user.analysis_started_at and user.analysis_started_at >= stale_before:
+                return None
+            logger.warning(f"Analysis {user.analysis_task_id} of {user.email} is stale, queueing a new one")
+            celery_app.control.revoke(user.analysis_task_id)
+
+    task = analyze_jobs_task.delay(user.email, llm_budget)
+    user.analysis_task_id = task.id
+    user.analysis_status = AnalysisStatus.IN_PROGRESS
+    user.analysis_started_at = datetime.utcnow()
+    session.add(user)
+    session.commit()
+    return task.id
 
 @celery_app.task(name="analyze_jobs_task")
-def analyze_jobs_task(user_email: str):
+def analyze_jobs_task(user_email: str, llm_budget: Optional[int] = ANALYSIS_LLM_BUDGET):
     """
     Background task to analyze un-analyzed jobs using LLM.
+    The jobs are sent to the agents in order of their local relevance score,
+    and only the top `llm_budget` jobs are analyzed if a budget is given.
     """
 
     logger.info(f"Retrieving user with email {user_email}")
     session = get_session()
-    processed_count = 0
+    relevant_count = 0
+    inherited_count = 0
+    analysis_run = None
+    call_trackers = new_call_trackers()
+    progress = AnalysisProgress(user_email=user_email, task_id=analyze_jobs_task.request.id)
     try:
         user = get_user(
-            email="scoutling@scoutling.com",
+            email=user_email,
             session=session
         )
         if not user:
             logger.warning(f"No user with email {user_email}")
             return "User not found"
+        progress.publish('started')
 
         # Make sure status reflects reality
         user.analysis_status = AnalysisStatus.IN_PROGRESS
@@ -87,89 +315,173 @@ def analyze_jobs_task(user_email: str):
         session.add(user)
         session.commit()
 
+        analysis_run = create_analysis_run(
+            user=user,
+            task_id=analyze_jobs_task.request.id,
+            session=session
+        )
+
         if not user.job_titles and not user.job_countries:
             logger.warning(f"no countries and job titles are set for the user {user.name}")
+            finish_analysis_run(
+                analysis_run=analysis_run,
+                status=AnalysisStatus.COMPLETED,
+                stage_summaries={},
+                session=session
+            )
             user.analysis_status = AnalysisStatus.COMPLETED
             user.analysis_task_id = None
             user.analysis_started_at = None
             session.add(user)
             session.commit()
-            return f"Analyzed {processed_count} new jobs."
-
-        linkedin_wrapper = LinkedinWrapper()
-
-        # retrieve the jobs since the last job search
-        time_filter = None
-        if user.last_job_search:
-            time_filter = (datetime.utcnow() - user.last_job_search).seconds
+            progress.publish('completed', jobs_relevant=relevant_count)
+            return f"Found {relevant_count} new relevant jobs."
 
         user.last_job_search = datetime.utcnow()
         session.add(user)
 
-        # get all the jobs from Linkedin
-        logger.info(f"Starting to retrieve jobs from linkedin in the timespan of {time_filter}")
-        all_linkedin_jobs = get_all_jobs(
-            linkedin_wrapper=linkedin_wrapper,
-            job_titles=user.job_titles,
-            job_countries=user.job_countries,
-            time_filter=time_filter
-        )
-        if len(all_linkedin_jobs) == 0:
-            logger.warning(f"no jobs found on linked for {user.name} in timespan of {time_filter} seconds")
+        # the searches are shared between the users, only the ones no user crawled recently are crawled,
+        # the jobs of the others are already stored and get analyzed below
+        jobs_by_query, n_inserted = crawl_queries(queries=user_queries(user), session=session, progress=progress)
+        crawled_jobs = [job for jobs in jobs_by_query.values() for job in jobs]
+        progress.publish('crawled', jobs_crawled=len(crawled_jobs))
+        # the jobs new to the database, the others were already stored by an earlier crawl
+        progress.publish('inserted', jobs_inserted=n_inserted)
+
+        # distill the resume before loading the jobs, committing the profile would expire the loaded jobs
+        resume = get_filter_resume(user, session, call_tracker=call_trackers['resume_profiler'])
+
+        logger.info("Starting to retrieve the jobs without analysis from database")
+        # the jobs found by the searches of the user, without an analysis of the user,
+        # the anti-join is served by the unique (user_id, job_id) index of the analyses
+        jobs_to_process = list(session.exec(
+            select(Job).where(
+                Job.id.in_(query_jobs_statement(user_queries(user))),
+                ~select(JobAnalysis.id)
+                .where(JobAnalysis.job_id == Job.id)
+                .where(JobAnalysis.user_id == user.id)
+                .exists()
+            )
+        ).all())
+        if not jobs_to_process:
+            logger.info(f"No new jobs to analyze for {user.name}")
+            finish_analysis_run(
+                analysis_run=analysis_run,
+                status=AnalysisStatus.COMPLETED,
+                stage_summaries=summarize_call_trackers(call_trackers),
+                session=session,
+                jobs_crawled=len(crawled_jobs),
+            )
             user.analysis_status = AnalysisStatus.COMPLETED
             user.analysis_task_id = None
             user.analysis_started_at = None
             session.add(user)
             session.commit()
-            return f"Analyzed {processed_count} new jobs."
+            progress.publish('completed', jobs_relevant=relevant_count)
+            return f"Found {relevant_count} new relevant jobs."
 
-        # insert the jobs that just retrieved from Linkedin
-        insert_jobs(jobs=all_linkedin_jobs, session=session)
+        # the agent stages read every description, load them in bulk instead of lazily per job
+        load_job_descriptions(jobs=jobs_to_process, session=session)
 
-        logger.info("Starting to retrieve all the jobs from database")
-        all_db_jobs = session.exec(select(Job)).all()
-
-        jobs_to_process = []
-        for job in all_db_jobs:
-            # Check if analysis exists
-            existing = session.exec(
-                select(JobAnalysis)
-                .where(JobAnalysis.job_id == job.id)
-                .where(JobAnalysis.user_id == user.id)
-            ).first()
-
-            if existing:
+        # inherit the analysis of near-duplicates that were already analyzed
+        cluster_analyses = get_cluster_analyses(
+            user=user,
+            cluster_ids={job.cluster_id for job in jobs_to_process if job.cluster_id},
+            session=session
+        )
+        # the analyses are only added to the session once the run is done, see insert_analyses
+        inherited_analyses = []
+        jobs_without_analysis = []
+        for job in jobs_to_process:
+            cluster_analysis = cluster_analyses.get(job.cluster_id)
+            if cluster_analysis is None:
+                jobs_without_analysis.append(job)
                 continue
+            inherited_analyses.append(JobAnalysis(
+                job_id=job.id,
+                user_id=user.id,
+                is_relevant=cluster_analysis.is_relevant,
+                relevancy_reason=cluster_analysis.relevancy_reason,
+            ))
+        if inherited_analyses:
+            logger.info(f"Inherited the analysis of {len(inherited_analyses)} jobs from their near-duplicates")
+        progress.publish('inherited', jobs_inherited=len(inherited_analyses))
+
+        # only one job per near-duplicate cluster is sent to the agents
+        jobs_to_process, duplicate_jobs = group_near_duplicates(jobs_without_analysis)
 
-            jobs_to_process.append(job)
+        logger.info(f"Ranking {len(jobs_to_process)} jobs by local relevance")
+        jobs_to_process = rank_jobs(
+            jobs=jobs_to_process,
+            resume=user.resume_text,
+            job_titles=user.job_titles,
+            budget=llm_budget,
+        )
+        progress.publish('ranked', jobs_to_analyze=len(jobs_to_process))
 
         # Run both steps in a single async event loop to prevent connection issues
-        filtered_jobs, relevancy_reasons = run_async(
-            async_analysis_pipeline(user, jobs_to_process)
+        filtered_jobs, relevancy_reasons, rejected_jobs = run_async(
+            async_analysis_pipeline(user, jobs_to_process, resume, call_trackers, progress)
         )
+        progress.publish('filtered', jobs_relevant=len(filtered_jobs))
         
         logger.info("Successfully finished filtering jobs")
+        new_analyses = []
         for job, relevancy_reason in zip(filtered_jobs, relevancy_reasons):
-            # Save Analysis
-            analysis = JobAnalysis(
-                job_id=job.id,
-                user_id=user.id,
-                is_relevant=True,
-                relevancy_reason=relevancy_reason,
-            )
-            session.add(analysis)
-            processed_count += 1
+            # Save Analysis, for the job and its near-duplicates
+            for analyzed_job in [job] + duplicate_jobs.get(job.id, []):
+                analysis = JobAnalysis(
+                    job_id=analyzed_job.id,
+                    user_id=user.id,
+                    is_relevant=True,
+                    relevancy_reason=relevancy_reason,
+                )
+                new_analyses.append(analysis)
+        # the rejections are stored as well, so that the next runs don't send the same jobs to the agents again,
+        # the jobs whose LLM calls failed have no analysis and are retried on the next run
+        for job in rejected_jobs:
+            for analyzed_job in [job] + duplicate_jobs.get(job.id, []):
+                new_analyses.append(JobAnalysis(
+                    job_id=analyzed_job.id,
+                    user_id=user.id,
+                    is_relevant=False,
+                ))
 
-        session.commit()
+        stored_analyses = insert_analyses(analyses=inherited_analyses + new_analyses, session=session)
+        inherited_job_ids = {analysis.job_id for analysis in inherited_analyses}
+        inherited_count = sum(1 for analysis in stored_analyses if analysis.job_id in inherited_job_ids)
+        relevant_count = sum(1 for analysis in stored_analyses if analysis.is_relevant)
+        finish_analysis_run(
+            analysis_run=analysis_run,
+            status=AnalysisStatus.COMPLETED,
+            stage_summaries=summarize_call_trackers(call_trackers),
+            session=session,
+            jobs_crawled=len(crawled_jobs),
+            jobs_analyzed=len(jobs_to_process),
+            jobs_relevant=relevant_count,
+            jobs_inherited=inherited_count,
+        )
         user.analysis_status = AnalysisStatus.COMPLETED
         user.analysis_task_id = None
         user.analysis_started_at = None
         session.add(user)
         session.commit()
-        return f"Analyzed {processed_count} new jobs."
+        progress.publish('completed', jobs_relevant=relevant_count)
+        return f"Found {relevant_count} new relevant jobs."
     except Exception as exc:
+        # published first, the run is over for the client even if recording the failure fails too
+        progress.publish('failed')
+        # a failed statement leaves the transaction aborted, nothing can be written before the rollback
+        session.rollback()
+        if analysis_run:
+            finish_analysis_run(
+                analysis_run=analysis_run,
+                status=AnalysisStatus.FAILED,
+                stage_summaries=summarize_call_trackers(call_trackers),
+                session=session
+            )
         user = get_user(
-            email="scoutling@scoutling.com",
+            email=user_email,
             session=session
         )
         if user:
@@ -0,0 +1 @@
+from backend.ranking.relevance import BM25Scorer, rank_jobs
@@ -0,0 +1,141 @@
+import re
+from typing import List, Dict, Sequence, Optional, TYPE_CHECKING
+
+import numpy as np
+
+from backend.database.models import Job
+from backend.config import logger
+
+if TYPE_CHECKING:
+    # scipy is slow to import, it is only imported when a scorer is fitted
+    from scipy import sparse
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#.]*[a-z0-9+#]|[a-z0-9]")
+
+STOP_WORDS = frozenset({
+    'a', 'about', 'after', 'all', 'also', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'been', 'but', 'by',
+    'can', 'do', 'for', 'from', 'has', 'have', 'if', 'in', 'into', 'is', 'it', 'its', 'more', 'most', 'not',
+    'of', 'on', 'or', 'our', 'out', 'so', 'such', 'that', 'the', 'their', 'them', 'then', 'there', 'these',
+    'they', 'this', 'to', 'up', 'us', 'was', 'we', 'were', 'what', 'when', 'where', 'which', 'while', 'who',
+    'will', 'with', 'within', 'would', 'you', 'your',
+})
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases the text and splits it into tokens, dropping stop words.
+    Keeps characters such as '+', '#' and '.' inside tokens so that 'c++', 'c#' and 'node.js' survive.
+    """
+    if not text:
+        return []
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class BM25Scorer:
+    """
+    Okapi BM25 index over a corpus of documents, stored as a sparse document-term matrix
+    so that a query is scored against every document with a single sparse matrix-vector product.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self.weights: Optional["sparse.csr_matrix"] = None
+
+    def fit(self, documents: Sequence[str]) -> "BM25Scorer":
+        """
+        Builds the BM25 weight matrix of the given documents.
+        :param documents: the documents to index
+        :return: the fitted scorer
+        """
+        from scipy import sparse
+
+        rows, cols = [], []
+        for row, document in enumerate(documents):
+            for token in tokenize(document):
+                col = self.vocabulary.setdefault(token, len(self.vocabulary))
+                rows.append(row)
+                cols.append(col)
+
+        n_docs = len(documents)
+        # duplicate (row, col) entries are summed, which yields the term frequencies
+        term_freqs = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(n_docs, len(self.vocabulary)),
+            dtype=np.float32,
+        )
+        term_freqs.sum_duplicates()
+
+        doc_lengths = np.asarray(term_freqs.sum(axis=1)).ravel()
+        avg_doc_length = doc_lengths.mean() if n_docs and doc_lengths.mean() > 0 else 1.0
+        doc_freqs = np.bincount(term_freqs.indices, minlength=len(self.vocabulary))
+        idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+
+        # apply the BM25 saturation directly on the non-zero entries
+        row_of_entry = np.repeat(np.arange(n_docs), np.diff(term_freqs.indptr))
+        tf = term_freqs.data
+        length_norm = self.k1 * (1 - self.b + self.b * doc_lengths[row_of_entry] / avg_doc_length)
+        term_freqs.data = idf[term_freqs.indices] * tf * (self.k1 + 1) / (tf + length_norm)
+
+        self.weights = term_freqs
+        return self
+
+    def query_vector(self, weighted_queries: Sequence[tuple[str, float]]) -> np.ndarray:
+        """
+        Builds a dense query vector over the fitted vocabulary.
+        Terms that do not appear in the corpus are ignored since they cannot affect the ranking.
+        :param weighted_queries: pairs of (query text, weight)
+        :return:
+        """
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for text, weight in weighted_queries:
+            for token in set(tokenize(text)):
+                col = self.vocabulary.get(token)
+                if col is not None:
+                    vector[col] += weight
+        return vector
+
+    def score(self, weighted_queries: Sequence[tuple[str, float]]) -> np.ndarray:
+        """
+        Scores all the indexed documents against the given queries in one batched computation.
+        :param weighted_queries: pairs of (query text, weight)
+        :return: one score per document
+        """
+        if self.weights is None:
+            raise ValueError("BM25Scorer must be fitted before scoring")
+        return self.weights @ self.query_vector(weighted_queries)
+
+
+def rank_jobs(
+    jobs: List[Job],
+    resume: str,
+    job_titles: List[str],
+    budget: Optional[int] = None,
+    title_weight: float = 3.0,
+) -> List[Job]:
+    """
+    Ranks the jobs by their local relevance to the user's resume and searched job titles.
+    :param jobs: the jobs to rank
+    :param resume: the user's resume
+    :param job_titles: the job titles the user searches for
+    :param budget: the maximum number of jobs to keep, None keeps all the jobs
+    :param title_weight: the weight of the searched job titles relative to the resume
+    :return: the jobs sorted from the most to the least relevant, truncated to the budget
+    """
+    if not jobs:
+        return []
+
+    scorer = BM25Scorer().fit([f"{job.title}\n{job.title}\n{job.description or ''}" for job in jobs])
+    queries = [(resume or '', 1.0)] + [(title, title_weight) for title in job_titles or []]
+    scores = scorer.score(queries)
+
+    # stable sort keeps the original order between equally scored jobs
+    order = np.argsort(-scores, kind='stable')
+    ranked_jobs = [jobs[i] for i in order]
+
+    if budget is not None and len(ranked_jobs) > budget:
+        logger.info(f"LLM budget of {budget} jobs reached, skipping the {len(ranked_jobs) - budget} lowest scoring jobs")
+        ranked_jobs = ranked_jobs[:budget]
+
+    return ranked_jobs
@@ -1,15 +1,23 @@
 import asyncio
 import random
 import logging
-from typing import Callable
+import threading
+from typing import Any, Callable, Coroutine, Optional, TypeVar, TYPE_CHECKING
 
 import httpx
-from langchain_openai import ChatOpenAI
-from langchain_core.language_models import BaseChatModel
+
+from backend.config import set_openai_api_key
+
+if TYPE_CHECKING:
+    # the LLM stack is slow to import, it is only imported when an LLM is instantiated
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages.ai import UsageMetadata
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+T = TypeVar('T')
+
 class SingletonMeta(type):
     _instances = {}
 
@@ -79,7 +87,7 @@ async def async_with_concurrency(
 def llm_factory(
         model_name: str,
         kwargs
-) -> BaseChatModel:
+) -> "BaseChatModel":
     """
     Factory function to create llm model instances
     :param model_name: the name of the model
@@ -91,6 +99,9 @@ def llm_factory(
     verbosity=medium
     output_version="responses/v1"
 
+    Models starting with 'fake' build an offline FakeChatModel, the kwargs are its
+    latency, latency_jitter, failure_rate, output_tokens and seed.
+
     """
 
     if model_name.startswith('gpt-5'):
@@ -99,15 +110,123 @@ def llm_factory(
         if 'verbosity' not in kwargs:
             kwargs['verbosity'] = 'medium'
 
+        from langchain_openai import ChatOpenAI
+
+        set_openai_api_key()
         llm = ChatOpenAI(
             model=model_name,
             output_version="responses/v1",
             **kwargs
         )
+    elif model_name.startswith('fake'):
+        from backend.agents.fake_llm import FakeChatModel
+
+        llm = FakeChatModel(model_name=model_name, **kwargs)
     else:
         raise ValueError(f'Invalid model name: {model_name}')
 
     return llm
 
-def run_async(coro):
+def log_prompt_cache_usage(
+        stage: str,
+        usage_metadata: dict[str, "UsageMetadata"],
+) -> dict:
+    """
+    Logs and returns the cached and uncached prompt tokens of a run, aggregated over all the models used.
+    :param stage: the name of the stage the usage belongs to, e.g. 'job_filterer'
+    :param usage_metadata: the usage metadata per model, as collected by UsageMetadataCallbackHandler
+    :return: the input, cached input and uncached input tokens
+    """
+    input_tokens = 0
+    cached_input_tokens = 0
+    for usage in usage_metadata.values():
+        input_tokens += usage.get('input_tokens', 0)
+        cached_input_tokens += usage.get('input_token_details', {}).get('cache_read', 0)
+
+    cache_usage = {
+        'input_tokens': input_tokens,
+        'cached_input_tokens': cached_input_tokens,
+        'uncached_input_tokens': input_tokens - cached_input_tokens,
+    }
+    hit_rate = cached_input_tokens / input_tokens if input_tokens else 0.0
+    logger.info(
+        f"{stage} prompt tokens: {cached_input_tokens} cached, "
+        f"{cache_usage['uncached_input_tokens']} uncached ({hit_rate:.1%} cache hit rate)"
+    )
+    return cache_usage
+
+class BackgroundEventLoop:
+    """
+    An event loop running in a daemon thread for the lifetime of the process, the sync code submits coroutines to it.
+    The async resources bound to the loop, e.g. the HTTP pools of the LLM clients, survive across the calls,
+    unlike with asyncio.run which closes the loop, and everything bound to it, after every call.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.is_running():
+                return
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run, name="background-event-loop", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """
+        Runs the coroutine on the loop and blocks until it is done.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("run() called from the background event loop, await the coroutine instead")
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            # e.g. the task was revoked or timed out, don't leave the coroutine running on the loop
+            future.cancel()
+            raise
+
+    def stop(self):
+        """
+        Cancels the pending tasks, stops the loop and closes it.
+        """
+        with self._lock:
+            if not self.is_running():
+                return
+
+            async def cancel_pending_tasks():
+                tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await self.loop.shutdown_asyncgens()
+
+            asyncio.run_coroutine_threadsafe(cancel_pending_tasks(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self.loop = None
+            self._thread = None
+
+
+background_loop = BackgroundEventLoop()
+
+
+def run_async(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    Runs the coroutine from sync code, on the background event loop if it was started (see the celery worker),
+    otherwise on a new event loop.
+    """
+    if background_loop.is_running():
+        return background_loop.run(coro)
     return asyncio.run(coro)
\ No newline at end of file
@@ -2,6 +2,7 @@ import { useState, useEffect } from 'react';
 import Header from './components/Header';
 import ResumeEditor from './components/ResumeEditor';
 import api from './api';
+import type { UserProfile } from './types';
 
 export default function Settings() {
   const [resume, setResume] = useState('');
@@ -16,17 +17,13 @@ export default function Settings() {
   useEffect(() => {
     const loadUserData = async () => {
       try {
-        const [instResponse, resumeResponse, countriesResponse, titlesResponse] = await Promise.all([
-          api.get<string>('/user/instructions'),
-          api.get<string>('/user/resume'),
-          api.get<string[]>('/user/job_search_countries'),
-          api.get<string[]>('/user/job_search_titles')
-        ]);
-
-        setInstructions(instResponse.data || '');
-        setResume(resumeResponse.data || '');
-        setSelectedCountries(countriesResponse.data || []);
-        setJobTitles(titlesResponse.data || []);
+        // one request for the whole profile, revalidated by the browser with its ETag
+        const { data: profile } = await api.get<UserProfile>('/user/profile');
+
+        setInstructions(profile.instructions || '');
+        setResume(profile.resume || '');
+        setSelectedCountries(profile.job_search_countries || []);
+        setJobTitles(profile.job_search_titles || []);
       } catch (error) {
         console.error("Failed to load user settings", error);
       } finally {
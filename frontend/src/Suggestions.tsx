@@ -1,21 +1,30 @@
 import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import JobCard from './components/JobCard';
-import type { Job } from './types';
+import type { Job, UserProfile } from './types';
 import api from './api';
 
-// Helper interface matching your Backend's FilteredJob schema
-interface FilteredJobResponse {
+// Helper interfaces matching your Backend's FilteredJobSummary, FilteredJobsPage and FilteredJob schemas
+interface FilteredJobSummaryResponse {
   id: number;
   linkedin_job_id: string;
   title: string;
   company: string | null;
   location: string | null;
   url: string;
-  description: string | null;
   relevant: boolean;
   relevancy_reason: string;
   applied: boolean;
+  analyzed_at: string;
+}
+
+interface FilteredJobsPageResponse {
+  items: FilteredJobSummaryResponse[];
+  next_cursor: string | null;
+}
+
+interface FilteredJobResponse extends Omit<FilteredJobSummaryResponse, 'analyzed_at'> {
+  description: string | null;
 }
 
 interface AnalysisStatus {
@@ -25,19 +34,70 @@ interface AnalysisStatus {
   started_at?: string | null;
 }
 
+// Matches the progress events published by the worker, streamed by /jobs/filter/events
+interface AnalysisProgressEvent {
+  task_id: string | null;
+  stage: string;
+  jobs_crawled?: number | null;
+  jobs_inserted?: number | null;
+  jobs_inherited?: number | null;
+  jobs_to_analyze?: number | null;
+  jobs_shortlisted?: number | null;
+  jobs_relevant?: number | null;
+  done?: number | null;
+  total?: number | null;
+  eta_seconds?: number | null;
+}
+
+const STAGE_LABELS: Record<string, string> = {
+  queued: 'Waiting for the worker',
+  started: 'Starting the analysis',
+  crawling: 'Crawling LinkedIn',
+  crawled: 'Crawled LinkedIn',
+  inserted: 'Storing the jobs',
+  inherited: 'Reusing the analyses of duplicate jobs',
+  ranked: 'Ranking the jobs',
+  shortlisting: 'Shortlisting the jobs',
+  shortlisted: 'Shortlisted the jobs',
+  filtering: 'Matching the jobs against your resume',
+  filtered: 'Saving the suggestions',
+};
+
+const describeProgress = (event: AnalysisProgressEvent): string => {
+  const parts = [STAGE_LABELS[event.stage] ?? event.stage];
+  if (event.done != null && event.total != null) parts.push(`${event.done}/${event.total}`);
+  if (event.eta_seconds != null) parts.push(`~${Math.ceil(event.eta_seconds)}s left`);
+  return parts.join(' · ');
+};
+
+const describeCounts = (event: AnalysisProgressEvent): string => {
+  const counts = [
+    event.jobs_crawled != null && `${event.jobs_crawled} crawled`,
+    event.jobs_inherited ? `${event.jobs_inherited} duplicates` : false,
+    event.jobs_to_analyze != null && `${event.jobs_to_analyze} to analyze`,
+    event.jobs_shortlisted != null && `${event.jobs_shortlisted} shortlisted`,
+    event.jobs_relevant != null && `${event.jobs_relevant} relevant`,
+  ];
+  return counts.filter(Boolean).join(' · ');
+};
+
 export default function Suggestions() {
   const navigate = useNavigate();
   const [analyzing, setAnalyzing] = useState(false);
   const [showOverlay, setShowOverlay] = useState(false);
   const overlayDismissedRef = useRef(false);
   const [analysisStatus, setAnalysisStatus] = useState<AnalysisStatus>({ status: 'idle' });
+  const [progress, setProgress] = useState<AnalysisProgressEvent | null>(null);
+  const eventSourceRef = useRef<EventSource | null>(null);
   const [relevantJobs, setRelevantJobs] = useState<Job[]>([]);
   const [selectedJob, setSelectedJob] = useState<Job | null>(null);
 
   // Filters State
   const [filterApplied, setFilterApplied] = useState<string>('all');
   const [filterLimit, setFilterLimit] = useState<number>(10);
-  const [start, setStart] = useState(0);
+  // cursors of the pages visited so far, the last one is the cursor of the current page
+  const [pageCursors, setPageCursors] = useState<(string | null)[]>([null]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
 
   // Validation Modal State
   const [showValidationModal, setShowValidationModal] = useState(false);
@@ -45,63 +105,78 @@ export default function Suggestions() {
   const [showAppliedPrompt, setShowAppliedPrompt] = useState(false);
 
   // Calculated values for pagination
-  const currentPage = Math.floor(start / filterLimit) + 1;
+  const currentPage = pageCursors.length;
 
   useEffect(() => {
-    fetchSuggestions(0);
+    fetchSuggestions([null]);
     api.get<AnalysisStatus>('/jobs/filter/status').then(response => {
         setAnalysisStatus(response.data);
         if (response.data.status === 'IN_PROGRESS') {
-            startPolling();
+            followAnalysis();
         }
     }).catch(err => console.error(err));
+    return () => eventSourceRef.current?.close();
   }, []);
 
   useEffect(() => {
-      fetchSuggestions(0);
+      fetchSuggestions([null]);
   }, [filterApplied, filterLimit]);
 
   useEffect(() => {
     setShowAppliedPrompt(false);
   }, [selectedJob?.linkedin_job_id]);
 
-  const fetchSuggestions = async (offset: number = 0) => {
+  const fetchSuggestions = async (cursors: (string | null)[]) => {
     try {
-      const params: any = { limit: filterLimit, offset: offset };
+      const cursor = cursors[cursors.length - 1];
+      // the rejected jobs are stored as analyses too, only the relevant ones are suggested
+      const params: any = { limit: filterLimit, relevant: true };
+      if (cursor) params.cursor = cursor;
       if (filterApplied === 'applied') params.applied = true;
       else if (filterApplied === 'not_applied') params.applied = false;
 
-      const response = await api.get<FilteredJobResponse[]>('/jobs/filter', { params });
-      const mappedJobs: Job[] = response.data.map(item => ({
+      const response = await api.get<FilteredJobsPageResponse>('/jobs/filter', { params });
+      const mappedJobs: Job[] = response.data.items.map(item => ({
         linkedin_job_id: item.linkedin_job_id,
         title: item.title,
         company: item.company,
         location: item.location,
         url: item.url,
-        description: item.description,
+        description: null,
         relevant: item.relevant,
         relevancy_reason: item.relevancy_reason,
         applied: item.applied
       }));
 
       setRelevantJobs(mappedJobs);
-      setStart(offset);
+      setPageCursors(cursors);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error("Failed to load suggestions", error);
     }
   };
 
-  const goToPage = (page: number) => {
-    const newStart = (page - 1) * filterLimit;
-    fetchSuggestions(newStart);
-  };
-
   const handleNext = () => {
-    goToPage(currentPage + 1);
+    if (nextCursor) fetchSuggestions([...pageCursors, nextCursor]);
   };
 
   const handlePrev = () => {
-    if (currentPage > 1) goToPage(currentPage - 1);
+    if (currentPage > 1) fetchSuggestions(pageCursors.slice(0, -1));
+  };
+
+  // The list only carries job summaries, the description is loaded when a job is selected
+  const selectJob = async (job: Job) => {
+    setSelectedJob(job);
+    if (job.description) return;
+
+    try {
+      const response = await api.get<FilteredJobResponse>(`/job/analysis/${job.linkedin_job_id}`);
+      const description = response.data.description;
+      setSelectedJob(prev => prev?.linkedin_job_id === job.linkedin_job_id ? { ...prev, description } : prev);
+      setRelevantJobs(prev => prev.map(j => j.linkedin_job_id === job.linkedin_job_id ? { ...j, description } : j));
+    } catch (error) {
+      console.error("Failed to load job description", error);
+    }
   };
 
   const handleApplyClick = (e: React.MouseEvent, url: string) => {
@@ -141,6 +216,49 @@ export default function Suggestions() {
     }
   };
 
+  const finishAnalysis = async (failed: boolean) => {
+      setAnalyzing(false);
+      await fetchSuggestions([null]);
+      overlayDismissedRef.current = false;
+
+      if (failed) {
+          setShowOverlay(false);
+      } else {
+          setTimeout(() => setShowOverlay(false), 2000);
+      }
+  };
+
+  // Follows the analysis through the progress events, and falls back to polling the status if the stream fails
+  const followAnalysis = () => {
+      setAnalyzing(true);
+      if (!overlayDismissedRef.current) {
+          setShowOverlay(true);
+      }
+
+      eventSourceRef.current?.close();
+      const eventSource = new EventSource(`${api.defaults.baseURL}/jobs/filter/events`);
+      eventSourceRef.current = eventSource;
+
+      eventSource.onmessage = async (message) => {
+          const event: AnalysisProgressEvent = JSON.parse(message.data);
+          setProgress(event);
+          if (event.stage === 'completed' || event.stage === 'failed') {
+              eventSource.close();
+              setAnalysisStatus({ status: event.stage === 'completed' ? 'COMPLETED' : 'FAILED', task_id: event.task_id });
+              await finishAnalysis(event.stage === 'failed');
+          }
+      };
+
+      eventSource.onerror = () => {
+          // the stream ended without a final event, or the backend can't stream
+          eventSource.close();
+          if (eventSourceRef.current === eventSource) {
+              eventSourceRef.current = null;
+              startPolling();
+          }
+      };
+  };
+
   const startPolling = () => {
       setAnalyzing(true);
       if (!overlayDismissedRef.current) {
@@ -158,15 +276,7 @@ export default function Suggestions() {
 
               if (!isRunning || attempts >= maxAttempts) {
                   clearInterval(interval);
-                  setAnalyzing(false);
-                  await fetchSuggestions(0);
-                  overlayDismissedRef.current = false;
-
-                  if (status?.status === 'FAILED' || attempts >= maxAttempts) {
-                      setShowOverlay(false);
-                  } else {
-                      setTimeout(() => setShowOverlay(false), 2000);
-                  }
+                  await finishAnalysis(status?.status === 'FAILED' || attempts >= maxAttempts);
               }
           } catch (err) {
               console.error("Polling error", err);
@@ -176,15 +286,11 @@ export default function Suggestions() {
 
   const runAIFilter = async () => {
     try {
-        const [resumeRes, countriesRes, titlesRes] = await Promise.all([
-            api.get<string>('/user/resume'),
-            api.get<string[]>('/user/job_search_countries'),
-            api.get<string[]>('/user/job_search_titles')
-        ]);
+        const { data: profile } = await api.get<UserProfile>('/user/profile');
 
-        const resume = resumeRes.data;
-        const countries = countriesRes.data;
-        const titles = titlesRes.data;
+        const resume = profile.resume;
+        const countries = profile.job_search_countries;
+        const titles = profile.job_search_titles;
 
         const missing = [];
         if (!resume || resume.trim().length < 10) missing.push("Resume");
@@ -207,12 +313,13 @@ export default function Suggestions() {
     setAnalyzing(true);
 
     try {
+        setProgress(null);
         await api.post('/jobs/filter');
-        startPolling();
+        followAnalysis();
     } catch (error: unknown) {
         const apiError = error as { response?: { status: number } };
         if (apiError.response?.status === 409) {
-            startPolling();
+            followAnalysis();
         } else {
             console.error("AI Analysis failed", error);
             alert("Failed to trigger analysis. Ensure Backend & Worker are running.");
@@ -287,6 +394,13 @@ export default function Suggestions() {
                     : "We have updated your suggestions."}
             </p>
 
+            {analyzing && progress && (
+                <div className="-mt-4 mb-8 text-center">
+                    <p className="text-sm font-medium text-brand-700 dark:text-brand-200">{describeProgress(progress)}</p>
+                    <p className="text-xs text-brand-500 dark:text-brand-400 mt-1">{describeCounts(progress)}</p>
+                </div>
+            )}
+
             <button
                 onClick={() => {
                   setShowOverlay(false);
@@ -380,7 +494,7 @@ export default function Suggestions() {
                         <JobCard
                             job={job}
                             isSelected={selectedJob?.linkedin_job_id === job.linkedin_job_id}
-                            onClick={() => setSelectedJob(job)}
+                            onClick={() => selectJob(job)}
                         />
                         
                         {/* Relevancy Indicator - Professional */}
@@ -408,7 +522,7 @@ export default function Suggestions() {
 
                 <button
                 onClick={handleNext}
-                disabled={analyzing || (relevantJobs.length < filterLimit && relevantJobs.length > 0)}
+                disabled={analyzing || !nextCursor}
                 className="px-3 py-1.5 rounded-md text-sm font-medium text-brand-600 dark:text-brand-300 hover:bg-white dark:hover:bg-brand-800 hover:shadow-sm border border-transparent hover:border-brand-200 dark:hover:border-brand-700 disabled:opacity-50 disabled:hover:bg-transparent transition-all"
                 >
                 Next
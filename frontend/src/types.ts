@@ -9,3 +9,12 @@ export interface Job {
   relevancy_reason?: string;
   applied?: boolean;
 }
+
+export interface UserProfile {
+  name: string;
+  email: string;
+  resume: string;
+  instructions: string;
+  job_search_countries: string[];
+  job_search_titles: string[];
+}